@@ -1,11 +1,22 @@
 import os
 from flask import Flask, jsonify
 from .events import socketio
+from .enrichment import location_enricher
 from .extensions import db, login_manager, migrate
+from .file_store import file_store
+from .geocoding import geocoder
+from .map_clusters import cluster_cache
+from .recommendation_cache import recommendation_cache
+from .spatial_index import listing_spatial_index
+from .swipe_deck import swipe_decks
+from .tag_index import tag_index
+from .thumbnails import thumbnailer
+from .uploads import UploadRequest
 from flask_cors import CORS
 
 def create_app():
     app = Flask(__name__, template_folder = "dist", static_folder = "dist/static", static_url_path = "/static")
+    app.request_class = UploadRequest
     
     # Load configuration
     env = os.environ.get('FLASK_ENV', 'production')
@@ -20,6 +31,15 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    recommendation_cache.init_app(app)
+    listing_spatial_index.init_app(app)
+    tag_index.init_app(app)
+    geocoder.init_app(app)
+    location_enricher.init_app(app)
+    swipe_decks.init_app(app)
+    cluster_cache.init_app(app)
+    file_store.init_app(app)
+    thumbnailer.init_app(app)
     
     @login_manager.unauthorized_handler
     def unauthorized():
@@ -55,6 +75,18 @@ def create_app():
 
     from app.api.matches import matches as matches_blueprint
     app.register_blueprint(matches_blueprint, url_prefix = "/api")
+    
+    # Register CLI commands
+    from app.commands import backfill_geohashes, deduplicate_locations, download_geocoder_data, enrich_locations, import_listings_command, migrate_blobs, precompute_recommendations, prune_blobs, prune_profile_pictures
+    app.cli.add_command(backfill_geohashes)
+    app.cli.add_command(deduplicate_locations)
+    app.cli.add_command(download_geocoder_data)
+    app.cli.add_command(enrich_locations)
+    app.cli.add_command(import_listings_command)
+    app.cli.add_command(migrate_blobs)
+    app.cli.add_command(precompute_recommendations)
+    app.cli.add_command(prune_blobs)
+    app.cli.add_command(prune_profile_pictures)
 
     # Register socketio
     socketio.init_app(app,
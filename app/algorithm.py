@@ -1,9 +1,26 @@
+from datetime import datetime, timedelta, timezone
+from flask import current_app
 from geodistpy import geodist
+import numpy as np
+from sqlalchemy import and_, or_, true
 
 from .extensions import db
-from .models import Listing, Location, Swipe
+from .geocells import cells_filter, covering_cells, haversine
+from .models import Listing, ListingRecommendation, Location, Swipe
+from .recommendation_cache import recommendation_cache
+from .spatial_index import listing_spatial_index
+from .swipe_deck import SwipeDeck, swipe_decks
+from .tag_index import tag_index
+from .ttl_cache import MISSING
 from .utilities import CustomHTTPError, similarity
 
+# Categories each listing category can be matched with
+CATEGORY_COMPATIBILITY = {
+    "short-term": ["short-term", "hosting"],
+    "long-term": ["long-term", "hosting"],
+    "hosting": ["short-term", "long-term"]
+}
+
 def listing_tag_similarity(listing1_id: int, listing2_id: int):
     """Calculate asymmetric similarity of listing 1 with listing 2.
 
@@ -29,6 +46,33 @@ def listing_tag_similarity(listing1_id: int, listing2_id: int):
     
     return similarity(listing1.tags, listing2.tags)
 
+def listing_tag_similarities(listing_id: int, candidate_ids: list[int]) -> np.ndarray:
+    """Calculate asymmetric tag similarity of a listing with every candidate in one pass.
+    
+    Tag-overlap counts come from merging the posting lists of the reference listing's tags in
+    the in-memory tag index, so no query or per-candidate set is needed. Equivalent to calling
+    `listing_tag_similarity` on each active candidate.
+
+    Args:
+        listing_id (int): Reference listing ID
+        candidate_ids (list[int]): Target listing IDs
+
+    Returns:
+        np.ndarray: Tag similarities out of 1, aligned with `candidate_ids`
+    """
+    reference_tag_ids = tag_index.get_tag_ids(listing_id)
+    
+    if not candidate_ids or not reference_tag_ids:
+        return np.zeros(len(candidate_ids))
+    
+    overlap_counts = tag_index.overlap_counts(reference_tag_ids, among = set(candidate_ids))
+    
+    return np.fromiter(
+        (overlap_counts[candidate_id] for candidate_id in candidate_ids),
+        dtype = float,
+        count = len(candidate_ids)
+    ) / len(reference_tag_ids)
+
 def feasible_listings_in_range(listing_id: int):
     listing: Listing = db.session.get(Listing, listing_id)
     
@@ -54,6 +98,76 @@ def feasible_listings_in_range(listing_id: int):
     
     return listings
 
+def feasible_listing_ids_in_range(listing_id: int) -> list[int]:
+    """Find the active listings within a listing's radius whose own radius also covers it.
+    
+    Answered with one query and vectorized distances, or from the in-process spatial index
+    when the `LISTING_SPATIAL_INDEX` setting is on. Each process then holds its own copy of the
+    index, reloaded every `LISTING_SPATIAL_INDEX_MAX_AGE` seconds.
+
+    Args:
+        listing_id (int): Reference listing ID
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        list[int]: Feasible listing IDs, excluding the reference listing
+    """
+    if not current_app.config.get("LISTING_SPATIAL_INDEX", False):
+        return feasible_listing_ids_in_range_from_database(listing_id)
+    
+    entry = listing_spatial_index.get(listing_id)
+    
+    if not entry:
+        if not db.session.get(Listing, listing_id):
+            raise CustomHTTPError(f"Listing #{listing_id} not found.", 404)
+        
+        return [] # Completed listings and listings without a location are not indexed
+    
+    return [id for id in listing_spatial_index.query(entry.point, entry.radius) if id != listing_id]
+
+def feasible_listing_ids_in_range_from_database(listing_id: int) -> list[int]:
+    """Vectorized equivalent of `feasible_listings_in_range` restricted to active listings.
+    
+    Pulls the coordinates and radii of all candidates in the geohash cells covering the
+    listing's radius with one query, then applies the mutual-radius condition as a mask over
+    haversine distances.
+
+    Args:
+        listing_id (int): Reference listing ID
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        list[int]: Feasible listing IDs, excluding the reference listing
+    """
+    listing: Listing | None = db.session.get(Listing, listing_id)
+    
+    if not listing:
+        raise CustomHTTPError(f"Listing #{listing_id} not found.", 404)
+    
+    if listing.is_complete or not listing.location:
+        return []
+    
+    latitude, longitude = listing.location.latitude, listing.location.longitude
+    rows = db.session.execute(
+        db.select(Listing.id, Location.latitude, Location.longitude, Listing.radius)
+        .join(Location, Location.id == Listing.location_id)
+        .filter(cells_filter(Location.geohash, covering_cells(latitude, longitude, listing.radius * 1000)))
+        .filter(Listing.id != listing_id)
+        .filter(Listing.is_complete == False)
+    ).all()
+    
+    if not rows:
+        return []
+    
+    ids, latitudes, longitudes, radii = (np.array(column) for column in zip(*rows))
+    distances = haversine(latitude, longitude, latitudes, longitudes) / 1000 # convert m to km
+    
+    return ids[(distances <= listing.radius) & (distances <= radii)].tolist()
+
 def listings_filtered_by_swipes(by_listing_id: int, on_listing_ids: list[int]) -> list[int]:
     """Filter out swiped listings. If all listings have been swiped, return passed listings.
 
@@ -67,8 +181,13 @@ def listings_filtered_by_swipes(by_listing_id: int, on_listing_ids: list[int]) -
     Returns:
         list[int]: Filtered listing IDs
     """
+    existing_listing_ids = set(db.session.execute(
+        db.select(Listing.id)
+        .filter(Listing.id.in_([by_listing_id] + on_listing_ids))
+    ).scalars())
+    
     for listing_id in ([by_listing_id] + on_listing_ids):
-        if not db.session.get(Listing, listing_id):
+        if listing_id not in existing_listing_ids:
             raise CustomHTTPError(f"Listing #{listing_id} not found.", 404)
         
     on_listing_ids = set(on_listing_ids)
@@ -91,18 +210,310 @@ def listings_filtered_by_swipes(by_listing_id: int, on_listing_ids: list[int]) -
     
     return list(on_listing_ids.difference(swiped_listing_ids)) # Return unswiped listings
 
-def listing_recommendations(listing_id: int):
-    feasible_listings = feasible_listings_in_range(listing_id)
+def listing_ids_by_swipe_status(swipe_statuses: dict[int, bool | None]) -> list[int]:
+    """Same filtering as `listings_filtered_by_swipes`, given whether each candidate was liked.
+
+    Args:
+        swipe_statuses (dict[int, bool | None]): Candidate listing IDs mapped to `is_like` of their swipe, None if unswiped
+
+    Returns:
+        list[int]: Unswiped listing IDs, or the passed ones if every candidate has been swiped
+    """
+    unswiped_listing_ids = [id for id, is_like in swipe_statuses.items() if is_like is None]
     
-    if not feasible_listings:
-        return None
+    if unswiped_listing_ids:
+        return unswiped_listing_ids
+    
+    return [id for id, is_like in swipe_statuses.items() if is_like == False] # Return the passed listings
+
+def candidate_listing_ids(listing_id: int) -> list[int]:
+    """Find the listings to recommend to a listing.
+    
+    Candidates are active listings in mutual range, of a compatible category, whose dates overlap
+    the listing's, filtered by `listing_ids_by_swipe_status`. Answered with a single query, or
+    from the in-process spatial index plus one query for the listing's swipes when the
+    `LISTING_SPATIAL_INDEX` setting is on.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        list[int]: Candidate listing IDs, in no particular order
+    """
+    if not current_app.config.get("LISTING_SPATIAL_INDEX", False):
+        return candidate_listing_ids_from_database(listing_id)
     
-    listing_ids: list[int] = listings_filtered_by_swipes(listing_id, [listing.id for listing in feasible_listings])
+    entry = listing_spatial_index.get(listing_id)
+    
+    if not entry:
+        if not db.session.get(Listing, listing_id):
+            raise CustomHTTPError(f"Listing #{listing_id} not found.", 404)
+        
+        return []
+    
+    listing_ids = listing_spatial_index.query(
+        entry.point,
+        entry.radius,
+        categories = CATEGORY_COMPATIBILITY.get(entry.category, []),
+        start = entry.start,
+        end = entry.end
+    )
+    swipe_statuses = dict(db.session.execute(
+        db.select(Swipe.swiped_on_listing_id, Swipe.is_like)
+        .filter_by(swiped_by_listing_id = listing_id)
+    ).all())
+    
+    return listing_ids_by_swipe_status({id: swipe_statuses.get(id) for id in listing_ids if id != listing_id})
+
+def candidate_listing_ids_from_database(listing_id: int) -> list[int]:
+    """Single-query equivalent of `candidate_listing_ids`.
+    
+    Joins listings with their locations and left-joins the listing's swipes, so the range
+    cells, activity, category and date filters all run in the database, along with the swipe
+    lookup. Only the exact mutual-radius check runs afterwards, vectorized over the result.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        list[int]: Candidate listing IDs, in no particular order
+    """
+    listing: Listing | None = db.session.get(Listing, listing_id)
+    
+    if not listing:
+        raise CustomHTTPError(f"Listing #{listing_id} not found.", 404)
+    
+    if listing.is_complete or not listing.location:
+        return []
+    
+    latitude, longitude = listing.location.latitude, listing.location.longitude
+    rows = db.session.execute(
+        db.select(Listing.id, Location.latitude, Location.longitude, Listing.radius, Swipe.is_like)
+        .join(Location, Location.id == Listing.location_id)
+        .outerjoin(Swipe, and_(Swipe.swiped_by_listing_id == listing_id, Swipe.swiped_on_listing_id == Listing.id))
+        .filter(cells_filter(Location.geohash, covering_cells(latitude, longitude, listing.radius * 1000)))
+        .filter(Listing.id != listing_id)
+        .filter(Listing.is_complete == False)
+        .filter(Listing.category.in_(CATEGORY_COMPATIBILITY.get(listing.category, [])))
+        .filter(or_(Listing.end_date.is_(None), Listing.end_date >= listing.start_date))
+        .filter(Listing.start_date <= listing.end_date if listing.end_date else true())
+    ).all()
+    
+    if not rows:
+        return []
+    
+    ids, latitudes, longitudes, radii, is_likes = zip(*rows)
+    distances = haversine(latitude, longitude, latitudes, longitudes) / 1000 # convert m to km
+    in_range = (distances <= listing.radius) & (distances <= np.array(radii))
+    
+    return listing_ids_by_swipe_status({id: is_like for id, is_like, is_in_range in zip(ids, is_likes, in_range) if is_in_range})
+
+def scored_recommendation_candidates(listing_id: int) -> tuple[list[int], np.ndarray] | None:
+    """Find the listings to recommend to a listing and their tag similarities, unordered.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        tuple[list[int], np.ndarray] | None: Candidate listing IDs and their aligned scores
+    """
+    listing_ids = candidate_listing_ids(listing_id)
     
     if not listing_ids:
         return None
     
-    tag_similarities = {id: listing_tag_similarity(listing_id, id) for id in listing_ids}
-    listing_ids_sorted_by_tag_similarity = sorted(tag_similarities, key = tag_similarities.get, reverse = True)
+    return listing_ids, listing_tag_similarities(listing_id, listing_ids)
+
+def ranked_recommendations(listing_id: int) -> tuple[list[int], list[float]] | None:
+    """Compute the recommendations of a listing and their tag similarities, most similar first.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        tuple[list[int], list[float]] | None: Ordered listing IDs and their scores
+    """
+    candidates = scored_recommendation_candidates(listing_id)
+    
+    if not candidates:
+        return None
+    
+    listing_ids, tag_similarities = candidates
+    order = np.argsort(-tag_similarities, kind = "stable")
+    
+    return [listing_ids[index] for index in order], tag_similarities[order].tolist()
+
+def stored_recommendations(listing_id: int) -> tuple[list[int], list[float]] | None:
+    """Read the precomputed recommendations of a listing, minus the listings it has swiped on since.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+
+    Returns:
+        tuple[list[int], list[float]] | None: Ordered listing IDs and their scores, None if missing, stale
+        or fully swiped (the live computation then decides what to show)
+    """
+    max_age = timedelta(seconds = current_app.config.get("RECOMMENDATION_PRECOMPUTE_MAX_AGE", 86400))
+    stored: ListingRecommendation | None = db.session.execute(
+        db.select(ListingRecommendation)
+        .filter_by(listing_id = listing_id, is_stale = False)
+        .filter(ListingRecommendation.computed_at >= datetime.now(timezone.utc) - max_age)
+    ).scalar_one_or_none()
+    
+    if not stored:
+        return None
+    
+    if not stored.listing_ids:
+        return [], []
+    
+    swiped_listing_ids = set(db.session.execute(
+        db.select(Swipe.swiped_on_listing_id)
+        .filter_by(swiped_by_listing_id = listing_id)
+    ).scalars())
+    recommendations = [(id, score) for id, score in zip(stored.listing_ids, stored.scores) if id not in swiped_listing_ids]
+    
+    if not recommendations:
+        return None
+    
+    listing_ids, scores = zip(*recommendations)
+    
+    return list(listing_ids), list(scores)
+
+def store_recommendations(listing_ids: list[int]) -> int:
+    """Compute and store the recommendations of listings, replacing any stored ones.
+
+    Args:
+        listing_ids (list[int]): Listing IDs to recommend to
+
+    Returns:
+        int: Number of listings whose recommendations were stored
+    """
+    computed_at = datetime.now(timezone.utc)
+    rows = []
+    
+    for listing_id in listing_ids:
+        try:
+            recommendations = ranked_recommendations(listing_id) or ([], [])
+        except CustomHTTPError: # Deleted since the batch started
+            continue
+        
+        rows.append({
+            "listing_id": listing_id,
+            "listing_ids": recommendations[0],
+            "scores": recommendations[1],
+            "computed_at": computed_at,
+            "is_stale": False
+        })
+    
+    try:
+        db.session.execute(
+            db.delete(ListingRecommendation)
+            .filter(ListingRecommendation.listing_id.in_(listing_ids))
+        )
+        
+        if rows:
+            db.session.execute(db.insert(ListingRecommendation), rows)
+        
+        db.session.commit()
+    except Exception as error:
+        print("Error storing listing recommendations:", error)
+        db.session.rollback()
+        
+        raise
+    
+    return len(rows)
+
+def listing_recommendations(listing_id: int, with_scores: bool = False, use_cache: bool = True):
+    """Recommend listings to a listing, most similar first.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+        with_scores (bool, optional): Also return the tag similarity of each recommendation. Defaults to False.
+        use_cache (bool, optional): Serve from and fill the recommendation cache, and read precomputed
+            recommendations. Defaults to True.
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        list[int] | tuple[list[int], list[float]] | None: Ordered listing IDs, with their scores if requested
+    """
+    recommendations = recommendation_cache.get(listing_id) if use_cache else MISSING
+    
+    if recommendations is MISSING:
+        recommendations = stored_recommendations(listing_id) if use_cache else None
+        
+        if recommendations is None:
+            recommendations = ranked_recommendations(listing_id)
+        
+        if use_cache:
+            recommendation_cache.set(listing_id, recommendations)
+    
+    if not recommendations or not recommendations[0]:
+        return None
+    
+    if with_scores:
+        return recommendations
+    
+    return recommendations[0]
+
+def invalidate_recommendations_around(listing_id: int):
+    """Drop the cached recommendations of a listing and of every listing that could recommend it,
+    and mark their precomputed recommendations as stale.
+
+    Range feasibility is mutual, so the listings that could recommend a listing are exactly the
+    listings feasible for it. Call this after the listing's tags change, after it is created,
+    and before it is deleted or moved (and again afterwards when moved or its radius changes).
+    """
+    try:
+        listing_ids = [listing_id] + feasible_listing_ids_in_range(listing_id)
+    except CustomHTTPError:
+        listing_ids = [listing_id]
+    
+    recommendation_cache.invalidate(listing_ids)
+    swipe_decks.invalidate(listing_ids)
+    
+    try:
+        db.session.execute(
+            db.update(ListingRecommendation)
+            .filter(ListingRecommendation.listing_id.in_(listing_ids))
+            .values(is_stale = True)
+        )
+        db.session.commit()
+    except Exception as error:
+        print(f"Error marking recommendations around listing #{listing_id} as stale:", error)
+        db.session.rollback()
+
+def deal_recommendations(listing_id: int, count: int) -> tuple[list[int], list[float]]:
+    """Deal the next recommendations from a listing's swipe deck, building the deck if needed.
+
+    Args:
+        listing_id (int): Listing ID to recommend to
+        count (int): Maximum number of recommendations to deal
+
+    Raises:
+        CustomHTTPError: 404, listing not found
+
+    Returns:
+        tuple[list[int], list[float]]: Next listing IDs and their scores, empty once the deck is exhausted
+    """
+    deck = swipe_decks.get(listing_id)
+    
+    if deck is MISSING:
+        candidates = scored_recommendation_candidates(listing_id)
+        deck = SwipeDeck(*candidates) if candidates else SwipeDeck([], [])
+        swipe_decks.set(listing_id, deck)
     
-    return listing_ids_sorted_by_tag_similarity
\ No newline at end of file
+    return deck.deal(count)
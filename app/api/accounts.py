@@ -4,6 +4,8 @@ import re
 from flask import Blueprint, current_app, jsonify, request, send_file
 from flask_login import current_user, login_required, login_user
 from werkzeug.security import generate_password_hash
+from ..thumbnails import send_picture, thumbnailer
+from ..uploads import store_upload, upload_error
 from ..models import ProfilePicture, Tag, User
 from ..extensions import db
 
@@ -173,19 +175,27 @@ def upload_profile_picture():
     if file.filename == "":
         return jsonify({"error": "No file selected."}), 400
 
-    try:
-        file_data = file.read()
-        file_type = file.content_type
-        
-        if not file_type.startswith('image/'):
-            return jsonify({"error": "Invalid file type."}), 400
+    image_error = upload_error([file])
 
-        if len(file_data) > 5 * 1024 * 1024:  # 5MB limit
-            return jsonify({"error": "Image too large."}), 400
+    if image_error:
+        return jsonify({"error": image_error}), 400
 
-        profile_picture = ProfilePicture(user_id = current_user.id, image_data = file_data, image_mimetype = file_type)
-        db.session.add(profile_picture)
+    try:
+        columns = store_upload(file)
+        # Uploading a previous picture again makes it current instead of storing a copy
+        profile_picture = db.session.execute(
+            db.select(ProfilePicture)
+            .filter_by(user_id = current_user.id, content_hash = columns["content_hash"])
+            .limit(1)
+        ).scalar_one_or_none()
+        
+        if not profile_picture:
+            profile_picture = ProfilePicture(user_id = current_user.id, **columns)
+            db.session.add(profile_picture)
+        
+        current_user.current_profile_picture = profile_picture
         db.session.commit()
+        thumbnailer.submit(profile_picture.content_hash)
 
         return "", 204
     except Exception as error:
@@ -196,17 +206,26 @@ def upload_profile_picture():
 
 @accounts.route("/users/<int:user_id>/profile-picture", methods = ["GET"])
 def get_profile_picture_from_user_id(user_id: int):
+    size = request.args.get("size", type = int)
+    
+    if size is not None and size <= 0:
+        return jsonify({"error": "Invalid size."}), 400
+    
     try:
         user = db.session.execute(db.select(User).filter_by(id = user_id)).scalar_one_or_none()
         
         if not user:
             return jsonify({"error": f"User #{user_id} not found."}), 404
 
-        profile_picture = user.profile_pictures.order_by(ProfilePicture.timestamp.desc()).first()
+        profile_picture = user.current_profile_picture
         
         if not profile_picture:
             return "", 204
         
+        # Revalidated on every use, as the URL stays the same when the user changes their picture
+        if profile_picture.content_hash:
+            return send_picture(profile_picture.content_hash, profile_picture.image_mimetype, size, current_app.config["PROFILE_PICTURE_CACHE_CONTROL"])
+        
         return send_file(BytesIO(profile_picture.image_data), profile_picture.image_mimetype), 200
     except Exception as error:
         print(f"Error retrieving profile picture for user {user.username}: {error}")
@@ -114,7 +114,7 @@ def get_chat_data(chat_id):
         "isGroup": chat.is_group,
         "title": chat.title,
         "members": [
-            {"id": u.id, "username": u.username, "profilePicUrl": f"/api/users/{u.id}/profile-picture"}
+            {"id": u.id, "username": u.username, "profilePicUrl": f"/api/users/{u.id}/profile-picture?size=64"}
             for u in chat.members
         ],
         "latestMessage": latest.content if latest else None,
@@ -190,7 +190,7 @@ def get_chat_matches():
                 {
                     "userId": user.id,
                     "username": user.username,
-                    "profilePicUrl": f"/api/users/{user.id}/profile-picture"
+                    "profilePicUrl": f"/api/users/{user.id}/profile-picture?size=64"
                 }
                 for user in matched_users
             ]
@@ -1,16 +1,26 @@
-from babel.numbers import get_territory_currencies
 from datetime import date, datetime
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, current_app, jsonify, request, send_file
 from flask_login import current_user, login_required
 from io import BytesIO
 from werkzeug.datastructures import FileStorage
 
+from ..algorithm import invalidate_recommendations_around
+from ..enrichment import PENDING, currency_for, location_enricher
 from ..extensions import db
+from ..file_store import release_blobs
+from ..map_clusters import invalidate_clusters
 from ..models import Listing, ListingPicture, Location, User, Tag
+from ..spatial_index import listing_spatial_index
+from ..tag_index import tag_index
+from ..thumbnails import send_picture, send_picture_bundle, thumbnailer
+from ..uploads import store_upload, upload_error
 from ..utilities import can_convert_to_float, can_convert_to_int, string_to_bool
 
 listings = Blueprint("listings", __name__)
 
+COVER_SIZE = 256 # pixels
+MAX_COVERS = 50 # listings per cover bundle
+
 @listings.route("/listings", methods = ["POST"])
 @login_required
 def create_listing():
@@ -72,20 +82,19 @@ def create_listing():
     
     prefers_same_gender = string_to_bool(prefers_same_gender)
     
-    location: Location | None = db.session.execute(
-        db.select(Location)
-        .filter_by(name = location_name)
-        .filter_by(latitude = latitude)
-        .filter_by(longitude = longitude)
-    ).scalars().first()
+    # Checked while the request was streamed in, so nothing is created for an invalid upload
+    image_error = upload_error(images)
+    
+    if image_error:
+        return jsonify({"error": image_error}), 400
     
-    if not location:
-        location = Location(latitude, longitude, location_name)
+    location = Location.get_or_create(latitude, longitude, location_name, geocode = not location_enricher.is_deferred)
     
-    if not location.country:
+    if not location.country and location.enrichment_status != PENDING:
         return jsonify({"error": "Invalid location."}), 400
     
-    currency = get_territory_currencies(location.country)[0]
+    # Pending locations get their country, and their listings a currency, from the location enricher
+    currency = currency_for(location.country) if location.country else None
     
     listing = Listing(
         user_id = current_user.id,
@@ -101,44 +110,32 @@ def create_listing():
     )
     
     location.listings.append(listing)
+    digests: list[str] = []
     
     try:
+        for image in images:
+            listing_picture = ListingPicture(**store_upload(image))
+            listing.pictures.append(listing_picture)
+            digests.append(listing_picture.content_hash)
+        
         db.session.add(listing)
         db.session.commit()
     except Exception as error:
         print("Error creating listing:", error)
         db.session.rollback()
+        release_blobs(digests)
         
         return jsonify({"error": str(error)}), 500
     
-    unsaved_images: list[str] = []
+    for digest in digests:
+        thumbnailer.submit(digest)
     
-    for image in images:
-        try:
-            file_data = image.read()
-            file_type = image.content_type
-            
-            if not file_type.startswith('image/'):
-                return jsonify({"error": "Invalid file type."}), 400
-
-            if len(file_data) > 5 * 1024 * 1024:  # 5MB limit
-                return jsonify({"error": "Image too large."}), 400
-            
-            listing_picture = ListingPicture(listing_id = listing.id, image_data = file_data, image_mimetype = file_type)
-            db.session.add(listing_picture)
-            db.session.commit()
-        except Exception as error:
-            db.session.rollback()
-            print(f"Error uploading listing image {image.filename}:", error)
-            unsaved_images.append(image.filename)
+    listing_spatial_index.upsert(listing)
+    invalidate_recommendations_around(listing.id)
+    invalidate_clusters(location.geohash)
     
-    if unsaved_images:
-        return jsonify({
-            "data": {
-                "id": listing.id,
-                "unsavedImages": unsaved_images
-            }
-        }), 207
+    if location.enrichment_status == PENDING:
+        location_enricher.submit(location.id)
     
     return jsonify({
         "data": listing.id
@@ -205,9 +202,20 @@ def delete_listing(listing_id: int):
     if not listing:
         return jsonify({"error": f"Listing #{listing_id} not found."}), 404
     
+    invalidate_recommendations_around(listing_id)
+    geohash = listing.location.geohash if listing.location else None
+    digests = db.session.execute(
+        db.select(ListingPicture.content_hash)
+        .filter_by(listing_id = listing_id)
+    ).scalars().all()
+    
     try:
         db.session.delete(listing)
         db.session.commit()
+        release_blobs(digests)
+        tag_index.remove_listing(listing_id)
+        listing_spatial_index.remove(listing_id)
+        invalidate_clusters(geohash)
         
         return "", 204
     except Exception as error:
@@ -244,6 +252,8 @@ def upload_listing_tags(listing_id: int):
             listing.tags.append(tag)
         
         db.session.commit()
+        tag_index.set_listing_tags(listing.id, [tag.id for tag in listing.tags])
+        invalidate_recommendations_around(listing.id)
         
         return "", 204
     except Exception as error:
@@ -284,6 +294,8 @@ def delete_tags(listing_id: int):
         try:
             listing.tags.clear()
             db.session.commit()
+            tag_index.remove_listing(listing.id)
+            invalidate_recommendations_around(listing.id)
             
             return "", 204
         except Exception as error:
@@ -303,6 +315,8 @@ def delete_tags(listing_id: int):
                 listing.tags.remove(tag)
         
         db.session.commit()
+        tag_index.set_listing_tags(listing.id, [tag.id for tag in listing.tags])
+        invalidate_recommendations_around(listing.id)
         
         return "", 204
     except Exception as error:
@@ -327,37 +341,61 @@ def upload_listing_pictures(listing_id: int):
     if not images:
         return jsonify({"error": "Missing listing picture."}), 400
     
-    unsaved_images: list[str] = []
+    image_error = upload_error(images)
     
-    for image in images:
-        try:
-            file_data = image.read()
-            file_type = image.content_type
-            
-            if not file_type.startswith('image/'):
-                return jsonify({"error": "Invalid file type."}), 400
-
-            if len(file_data) > 5 * 1024 * 1024:  # 5MB limit
-                return jsonify({"error": "Image too large."}), 400
-            
-            listing_picture = ListingPicture(listing_id = listing.id, image_data = file_data, image_mimetype = file_type)
-            db.session.add(listing_picture)
-            db.session.commit()
-        except Exception as error:
-            db.session.rollback()
-            print(f"Error uploading listing image {image.filename}:", error)
-            unsaved_images.append(image.filename)
+    if image_error:
+        return jsonify({"error": image_error}), 400
     
-    if unsaved_images:
-        return jsonify({
-            "data": {
-                "id": listing.id,
-                "unsavedImages": unsaved_images
-            }
-        }), 207
+    digests: list[str] = []
+    
+    try:
+        for image in images:
+            listing_picture = ListingPicture(**store_upload(image))
+            listing.pictures.append(listing_picture)
+            digests.append(listing_picture.content_hash)
+        
+        db.session.commit()
+    except Exception as error:
+        print(f"Error uploading pictures of listing #{listing_id}:", error)
+        db.session.rollback()
+        release_blobs(digests)
+        
+        return jsonify({"error": str(error)}), 500
+    
+    for digest in digests:
+        thumbnailer.submit(digest)
     
     return "", 204
 
+# First picture of each listing of `?ids=`, for the recommendation carousel to load them in one request
+@listings.get("/listings/covers")
+def get_listing_covers():
+    ids = request.args.get("ids", "").split(",")
+    size = request.args.get("size", COVER_SIZE, type = int)
+    
+    if not all(can_convert_to_int(id) for id in ids):
+        return jsonify({"error": "Invalid listing IDs."}), 400
+    
+    listing_ids = list(dict.fromkeys(int(id) for id in ids))
+    
+    if len(listing_ids) > MAX_COVERS:
+        return jsonify({"error": f"At most {MAX_COVERS} listings per request."}), 400
+    
+    if size <= 0:
+        return jsonify({"error": "Invalid size."}), 400
+    
+    covers = {row.listing_id: row for row in db.session.execute(ListingPicture.select_covers(listing_ids)).all()}
+    
+    if not covers:
+        return "", 204
+    
+    # Parts follow the order of the requested IDs, each named after its listing and with the picture ID as filename
+    return send_picture_bundle([
+        (str(listing_id), str(covers[listing_id].id), covers[listing_id].content_hash, covers[listing_id].image_mimetype)
+        for listing_id in listing_ids
+        if listing_id in covers
+    ], size)
+
 @listings.get("/listings/pictures/<int:listing_picture_id>")
 def get_listing_picture(listing_picture_id: int):
     listing_picture: ListingPicture | None = db.session.execute(
@@ -368,24 +406,48 @@ def get_listing_picture(listing_picture_id: int):
     if not listing_picture:
         return jsonify({"error": f"Listing picture #{listing_picture_id} not found."}), 404
     
+    size = request.args.get("size", type = int)
+    
+    if size is not None and size <= 0:
+        return jsonify({"error": "Invalid size."}), 400
+    
+    # A picture never changes, new pictures get new IDs
+    if listing_picture.content_hash:
+        return send_picture(listing_picture.content_hash, listing_picture.image_mimetype, size, current_app.config["LISTING_PICTURE_CACHE_CONTROL"])
+    
     return send_file(BytesIO(listing_picture.image_data), listing_picture.image_mimetype), 200
     
 @listings.get("/listings/<int:listing_id>/pictures/ids")
 def get_listing_picture_ids(listing_id: int):
-    listing: Listing | None = db.session.execute(
-        db.select(Listing)
-        .filter_by(id = listing_id)
-    ).scalar_one_or_none()
+    if not db.session.get(Listing, listing_id):
+        return jsonify({"error": f"Listing #{listing_id} not found."}), 404
     
-    if not listing:
+    picture_ids: list[int] = db.session.execute(
+        db.select(ListingPicture.id)
+        .filter_by(listing_id = listing_id)
+        .order_by(ListingPicture.id)
+    ).scalars().all()
+    
+    if not picture_ids:
+        return "", 204
+    
+    return jsonify({"data": picture_ids}), 200
+
+@listings.get("/listings/<int:listing_id>/pictures")
+def get_listing_pictures_metadata(listing_id: int):
+    if not db.session.get(Listing, listing_id):
         return jsonify({"error": f"Listing #{listing_id} not found."}), 404
     
-    pictures: list[ListingPicture] | None = listing.pictures.all()
+    rows = db.session.execute(
+        ListingPicture.select_metadata()
+        .filter_by(listing_id = listing_id)
+        .order_by(ListingPicture.id)
+    ).all()
     
-    if not pictures:
+    if not rows:
         return "", 204
     
-    return jsonify({"data": [picture.id for picture in pictures]}), 200
+    return jsonify({"data": [ListingPicture.metadata_to_dict(row) for row in rows]}), 200
 
 @listings.delete("/listings/pictures/<int:listing_picture_id>")
 @login_required
@@ -401,6 +463,7 @@ def delete_listing_picture(listing_picture_id: int):
     try:
         db.session.delete(listing_picture)
         db.session.commit()
+        release_blobs([listing_picture.content_hash])
         
         return "", 204
     except Exception as error:
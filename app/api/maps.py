@@ -1,26 +1,18 @@
 from flask import Blueprint, jsonify, request
-from geodistpy import geodist
-import math
-import requests
+from flask_login import login_required
 
-from config import GOOGLE_API_KEY
+from ..geocells import chord_to_metres
+from ..geocoding import geocoder
+from ..map_clusters import viewport_clusters
 from ..models import db, Location
 
 maps = Blueprint("maps", __name__)
 
+PAGE_SIZE = 20
+
 def create_location(latitude: float, longitude: float, name: str | None = None):
-    if db.session.execute(
-        db.select(Location)
-        .filter_by(name = name)
-        .filter_by(latitude = latitude)
-        .filter_by(longitude = longitude)
-    ).scalars().first():
-        return
-    
-    location = Location(latitude, longitude, name)
-    
     try:
-        db.session.add(location)
+        Location.get_or_create(latitude, longitude, name)
         db.session.commit()
     except Exception as error:
         print("Error creating location:", error)
@@ -38,65 +30,74 @@ def get_location_at_coordinate(latitude: float, longitude: float) -> Location |
     
     return [location for location in locations]
 
-def get_locations_within_radius(latitude: float, longitude: float, radius: float, page: int = 1) -> list[Location] | None:
-    """Get all locations within a certain radius (in metres) of a point."""
+def get_locations_within_radius(
+    latitude: float,
+    longitude: float,
+    radius: float,
+    page: int = 1,
+    after: tuple[float, int] | None = None
+) -> tuple[list[Location], list[float], tuple[float, int] | None]:
+    """Get a page of the locations within a certain radius (in metres) of a point, nearest first.
+    
+    Args:
+        page (int, optional): Page number, ignored when `after` is given. Defaults to 1.
+        after (tuple[float, int] | None, optional): Cursor returned with the previous page. Defaults to None.
+    
+    Returns:
+        tuple[list[Location], list[float], tuple[float, int] | None]: Locations, their distances in metres, and the cursor
+            of the next page if there may be one
+    """
     if radius < 0:
         raise ValueError("Radius must be positive.")
     
+    if page < 1:
+        raise ValueError("Page number must be positive.")
+    
     if radius == 0:
-        return get_location_at_coordinate(latitude, longitude)
+        locations = get_location_at_coordinate(latitude, longitude)
+        
+        return locations, [0.0] * len(locations), None
     
-    lat_min = latitude - radius / 111
-    lat_max = latitude + radius / 111
-    lon_min = longitude - radius / (111 * abs(math.cos(math.radians(latitude))))
-    lon_max = longitude + radius / (111 * abs(math.cos(math.radians(latitude))))
+    query = Location.select_by_distance(latitude, longitude, radius, after).limit(PAGE_SIZE)
     
-    results = db.session.execute(
-        db.select(Location)
-        .filter(Location.latitude.between(lat_min, lat_max))
-        .filter(Location.longitude.between(lon_min, lon_max))
-    ).scalars().all()
-    nearby = [location for location in results if geodist((location.latitude, location.longitude), (latitude, longitude)) <= radius]
+    if not after:
+        query = query.offset((page - 1) * PAGE_SIZE)
     
-    page_size = 20
-    start = (page - 1) * page_size
-    end = start + page_size
-    locations = nearby[start:end]
+    rows = db.session.execute(query).all()
+    cursor = (rows[-1][1], rows[-1][0].id) if len(rows) == PAGE_SIZE else None
     
-    return [location for location in locations]
+    return [location for location, _ in rows], [chord_to_metres(distance ** 0.5) for _, distance in rows], cursor
 
 def get_location_ids_within_radius(latitude: float, longitude: float, radius: float, page: int = 1) -> list[int] | None:
     """Get the IDs of all locations within a certain radius (in metres) of a point."""
     
-    locations = get_locations_within_radius(latitude, longitude, radius, page)
-    location_ids = [location.id for location in locations] if not isinstance(locations, Location) else [locations.id]
+    locations, _, _ = get_locations_within_radius(latitude, longitude, radius, page)
     
-    return location_ids
+    return [location.id for location in locations]
 
 def get_location_data(latitude: float, longitude: float) -> tuple[str, None] | tuple[None, str]:
-    response = requests.get(f"https://maps.googleapis.com/maps/api/geocode/json?latlng={latitude},{longitude}&key={GOOGLE_API_KEY}")
-    data = response.json()
-    
-    if data["status"] != "OK":
-        raise requests.HTTPError
-    
-    if not len(data["results"]):
-        raise AttributeError("No results for these coordinates.")
-    
-    country = None
-    locality = None
+    return geocoder.reverse_geocode(latitude, longitude)
+
+@maps.get("/geocoding/stats")
+@login_required
+def get_geocoding_stats():
+    return jsonify({"data": geocoder.stats()}), 200
+
+@maps.get("/maps/clusters")
+def get_clusters():
+    """Aggregate active listings per grid cell of a viewport, given as `bounds=south,west,north,east` and `zoom`."""
+    try:
+        south, west, north, east = (float(value) for value in request.args.get("bounds", "").split(","))
+        zoom = int(request.args.get("zoom", ""))
+    except ValueError:
+        return jsonify({"error": "Invalid bounds or zoom level."}), 400
     
-    for result in data["results"][0]["address_components"]:
-        if "country" in result["types"]:
-            country: str = result["short_name"]
-        
-        if "locality" in result["types"]:
-            locality: str = result["long_name"]
+    if not -90 <= south <= north <= 90 or abs(west) > 180 or abs(east) > 180 or not 0 <= zoom <= 22:
+        return jsonify({"error": "Invalid bounds or zoom level."}), 400
     
-    if not country and not locality:
-        raise AttributeError("Country and locality could not be found.")
+    precision, clusters = viewport_clusters(south, west, north, east, zoom)
     
-    return country, locality
+    return jsonify({"data": {"precision": precision, "clusters": clusters}}), 200
 
 @maps.route("/maps/locations")
 def get_locations():
@@ -122,14 +123,27 @@ def get_locations():
     page = request.args.get("page")
     page = int(page) if page else 1
     
-    if page < 0:
-        return jsonify({"error": "Page number must be postive."}), 400
+    if page < 1:
+        return jsonify({"error": "Page number must be positive."}), 400
+    
+    # Cursor of the next page, "<squared chord distance>,<location ID>" of the last location of the previous one
+    after = request.args.get("after")
+    
+    if after:
+        try:
+            distance, location_id = after.split(",")
+            after = (float(distance), int(location_id))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor."}), 400
     
     if latitude is not None and longitude is not None:
-        locations = get_locations_within_radius(latitude, longitude, radius, page)
-    else:
-        locations = db.paginate(db.select(Location), page = page)
+        locations, distances, cursor = get_locations_within_radius(latitude, longitude, radius, page, after)
         
-    location_data = [location.to_dict() for location in locations] if not isinstance(locations, Location) else locations.to_dict()
-        
-    return jsonify({"data": location_data})
\ No newline at end of file
+        return jsonify({
+            "data": [location.to_dict() | {"distance": distance} for location, distance in zip(locations, distances)],
+            "next": f"{cursor[0]!r},{cursor[1]}" if cursor else None
+        })
+    
+    locations = db.paginate(db.select(Location), page = page)
+    
+    return jsonify({"data": [location.to_dict() for location in locations]})
\ No newline at end of file
@@ -2,10 +2,12 @@ from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required
 from sqlalchemy import or_
 
-from ..algorithm import listing_recommendations
+from ..algorithm import deal_recommendations, listing_recommendations
 from ..extensions import db
 from ..models import Listing, Swipe, Match
-from ..utilities import CustomHTTPError
+from ..recommendation_cache import recommendation_cache
+from ..swipe_deck import swipe_decks
+from ..utilities import CustomHTTPError, can_convert_to_int, string_to_bool
 
 matches = Blueprint("matches", __name__)
 
@@ -23,15 +25,70 @@ def get_listing_recommendations(listing_id: int):
     if listing.user_id != current_user.id:
         return jsonify({"error": f"Listing #{listing_id} does not belong to user."}), 403
     
+    with_scores = string_to_bool(request.args.get("scores", "false"))
+    
     try:
-        listing_ids = listing_recommendations(listing_id)
+        recommendations = listing_recommendations(listing_id, with_scores = with_scores)
+    except CustomHTTPError as error:
+        return jsonify({"error": str(error)}), error.status_code
+    
+    if not recommendations:
+        return "", 204
+    
+    if with_scores:
+        listing_ids, scores = recommendations
+        
+        return jsonify({"data": listing_ids, "scores": scores}), 200
+    
+    return jsonify({"data": recommendations}), 200
+
+# Dealing moves the deck forward, so it is a POST that caches and prefetches never repeat
+@matches.post("/listings/<int:listing_id>/recommendations/deck")
+@login_required
+def deal_listing_recommendation_deck_page(listing_id: int):
+    listing: Listing | None = db.session.get(Listing, listing_id)
+    
+    if not listing:
+        return jsonify({"error": f"Listing #{listing_id} not found."}), 404
+    
+    if listing.user_id != current_user.id:
+        return jsonify({"error": f"Listing #{listing_id} does not belong to user."}), 403
+    
+    data = request.get_json(silent = True) or {}
+    size = str(data.get("size", 10))
+    
+    if not can_convert_to_int(size) or not 0 < int(size) <= 100:
+        return jsonify({"error": "Page size must be between 1 and 100."}), 400
+    
+    try:
+        listing_ids, scores = deal_recommendations(listing_id, int(size))
     except CustomHTTPError as error:
         return jsonify({"error": str(error)}), error.status_code
     
     if not listing_ids:
         return "", 204
     
-    return jsonify({"data": listing_ids}), 200
+    return jsonify({"data": listing_ids, "scores": scores}), 200
+
+@matches.delete("/listings/<int:listing_id>/recommendations/deck")
+@login_required
+def reset_listing_recommendation_deck(listing_id: int):
+    listing: Listing | None = db.session.get(Listing, listing_id)
+    
+    if not listing:
+        return jsonify({"error": f"Listing #{listing_id} not found."}), 404
+    
+    if listing.user_id != current_user.id:
+        return jsonify({"error": f"Listing #{listing_id} does not belong to user."}), 403
+    
+    swipe_decks.invalidate([listing_id])
+    
+    return "", 204
+
+@matches.get("/recommendations/cache")
+@login_required
+def get_recommendation_cache_stats():
+    return jsonify({"data": recommendation_cache.stats()}), 200
 
 @matches.post("/listings/<int:listing_id>/swipes")
 @login_required
@@ -139,6 +196,7 @@ def delete_swipe(swipe_id: int):
     try:
         db.session.delete(swipe)
         db.session.commit()
+        recommendation_cache.invalidate([swipe.swiped_by_listing_id])
         
         return "", 204
     except Exception as error:
@@ -0,0 +1,364 @@
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+import io
+import multiprocessing
+import os
+import requests
+import time
+import zipfile
+from sqlalchemy import exists, or_
+
+from .algorithm import store_recommendations
+from .enrichment import FAILED, PENDING, enrich_location
+from .extensions import db
+from .file_store import file_store, referenced_digests, release_blobs
+from .listing_import import import_listings, read_rows
+from .models import Listing, ListingPicture, Location, ProfilePicture, User
+from .offline_geocoder import COUNTRIES_FILE, PLACES_FILE
+
+_worker_app: Flask | None = None
+
+COUNTRIES_URL = "https://raw.githubusercontent.com/nvkelso/natural-earth-vector/master/geojson/ne_50m_admin_0_countries.geojson"
+PLACES_URL = "https://download.geonames.org/export/dump/cities1000.zip"
+
+@click.command("backfill-geohashes")
+@click.option("--batch-size", default = 1000, show_default = True, help = "Number of locations updated per transaction.")
+@with_appcontext
+def backfill_geohashes(batch_size: int):
+    """Compute the geohash and unit-sphere position of every location that does not have them yet."""
+    updated = 0
+
+    while True:
+        rows = db.session.execute(
+            db.select(Location.id, Location.latitude, Location.longitude)
+            .filter(or_(Location.geohash.is_(None), Location.unit_x.is_(None)))
+            .limit(batch_size)
+        ).all()
+
+        if not rows:
+            break
+
+        db.session.execute(
+            db.update(Location),
+            [{"id": id, **Location.spatial_columns(latitude, longitude)} for id, latitude, longitude in rows]
+        )
+        db.session.commit()
+        updated += len(rows)
+
+    click.echo(f"Backfilled {updated} location geohashes.")
+
+@click.command("deduplicate-locations")
+@with_appcontext
+def deduplicate_locations():
+    """Recompute the snap key of every location and merge locations sharing one into the oldest.
+    Run after migrating, or after changing LOCATION_SNAP_PRECISION."""
+    rows = db.session.execute(
+        db.select(Location.id, Location.latitude, Location.longitude, Location.name)
+        .order_by(Location.id)
+    ).all()
+    kept: dict[str, int] = {}
+    merged: dict[int, int] = {}
+
+    for id, latitude, longitude, name in rows:
+        key = Location.snap_key_for(latitude, longitude, name)
+
+        if key in kept:
+            merged[id] = kept[key]
+        else:
+            kept[key] = id
+
+    for location_id, kept_id in merged.items():
+        db.session.execute(
+            db.update(Listing)
+            .filter(Listing.location_id == location_id)
+            .values(location_id = kept_id)
+        )
+
+    if merged:
+        db.session.execute(db.delete(Location).filter(Location.id.in_(merged.keys())))
+
+    # Cleared first, as the new keys may collide with old keys of other rows
+    db.session.execute(db.update(Location).values(snap_key = None))
+    db.session.execute(
+        db.update(Location),
+        [{"id": id, "snap_key": key} for key, id in kept.items()]
+    )
+    db.session.commit()
+
+    click.echo(f"Merged {len(merged)} duplicate locations into {len(kept)}.")
+
+@click.command("download-geocoder-data")
+@click.option("--countries-url", default = COUNTRIES_URL, show_default = True, help = "GeoJSON of country boundaries with ISO_A2 properties.")
+@click.option("--places-url", default = PLACES_URL, show_default = True, help = "Zipped GeoNames dump of populated places.")
+@with_appcontext
+def download_geocoder_data(countries_url: str, places_url: str):
+    """Download the country boundaries and populated places used by the offline geocoder."""
+    data_folder = current_app.config["GEOCODER_DATA_FOLDER"]
+    os.makedirs(data_folder, exist_ok = True)
+
+    response = requests.get(countries_url, timeout = 60)
+    response.raise_for_status()
+
+    with open(os.path.join(data_folder, COUNTRIES_FILE), "wb") as file:
+        file.write(response.content)
+
+    response = requests.get(places_url, timeout = 60)
+    response.raise_for_status()
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        name = next(name for name in archive.namelist() if name.endswith(".txt"))
+
+        with archive.open(name) as source, open(os.path.join(data_folder, PLACES_FILE), "wb") as file:
+            file.write(source.read())
+
+    click.echo(f"Stored offline geocoder data in {data_folder}.")
+
+@click.command("enrich-locations")
+@click.option("--retry-failed", is_flag = True, help = "Also retry locations whose enrichment found no country.")
+@with_appcontext
+def enrich_locations(retry_failed: bool):
+    """Geocode the locations left pending enrichment, e.g. by a restart while they were queued."""
+    if retry_failed:
+        db.session.execute(
+            db.update(Location)
+            .filter(Location.enrichment_status == FAILED)
+            .values(enrichment_status = PENDING)
+        )
+        db.session.commit()
+
+    location_ids = db.session.execute(
+        db.select(Location.id)
+        .filter(Location.enrichment_status == PENDING)
+    ).scalars().all()
+    enriched = 0
+    unavailable = 0
+
+    for location_id in location_ids:
+        try:
+            enriched += bool(enrich_location(location_id))
+        except requests.RequestException as error:
+            db.session.rollback()
+            print(f"Geocoding unavailable for location #{location_id}:", error)
+            unavailable += 1
+
+    click.echo(f"Enriched {enriched} of {len(location_ids)} pending locations, {unavailable} left pending as geocoding was unavailable.")
+
+@click.command("import-listings")
+@click.argument("path", type = click.Path(exists = True, dir_okay = False))
+@click.option("--format", type = click.Choice(["csv", "ndjson"]), default = None, help = "Defaults to the file extension.")
+@click.option("--batch-size", default = 1000, show_default = True, help = "Number of rows imported per transaction.")
+@click.option("--defer-geocoding", is_flag = True, help = "Leave new locations pending enrichment, see enrich-locations.")
+@with_appcontext
+def import_listings_command(path: str, format: str | None, batch_size: int, defer_geocoding: bool):
+    """Import listings from a CSV or NDJSON file.
+
+    Rows have the fields of POST /listings plus user_id.
+    """
+    report = import_listings(read_rows(path, format), batch_size, defer_geocoding)
+
+    for error in report.errors:
+        click.echo(error, err = True)
+
+    click.echo(
+        f"Imported {report.imported} of {report.rows} rows ({report.invalid} invalid, {report.failed} failed) "
+        f"in {report.seconds:.1f}s, {report.rows_per_second:.0f} rows/s. "
+        f"Created {report.locations_created} locations, reused {report.locations_reused}, geocoded {report.geocoded} points."
+    )
+
+@click.command("migrate-blobs")
+@click.option("--batch-size", default = 100, show_default = True, help = "Number of pictures moved per transaction.")
+@with_appcontext
+def migrate_blobs(batch_size: int):
+    """Move picture data out of the database into the file store."""
+    moved = 0
+
+    for model in [ListingPicture, ProfilePicture]:
+        while True:
+            rows = db.session.execute(
+                db.select(model.id, model.image_data)
+                .filter(model.content_hash.is_(None))
+                .filter(model.image_data.is_not(None))
+                .limit(batch_size)
+            ).all()
+
+            if not rows:
+                break
+
+            db.session.execute(
+                db.update(model),
+                [{"id": id, "content_hash": file_store.put(image_data), "image_size": len(image_data), "image_data": None} for id, image_data in rows]
+            )
+            db.session.commit()
+            moved += len(rows)
+
+        # Pictures uploaded to the file store before their size was recorded
+        rows = db.session.execute(
+            db.select(model.id, model.content_hash)
+            .filter(model.content_hash.is_not(None))
+            .filter(model.image_size.is_(None))
+        ).all()
+
+        if rows:
+            db.session.execute(
+                db.update(model),
+                [{"id": id, "image_size": os.path.getsize(file_store.path(content_hash))} for id, content_hash in rows if file_store.exists(content_hash)]
+            )
+            db.session.commit()
+
+    click.echo(f"Moved {moved} pictures to {file_store.root}.")
+
+@click.command("prune-blobs")
+@with_appcontext
+def prune_blobs():
+    """Delete the files in the file store no picture refers to, e.g. left by deleted users.
+    Files stored within FILE_STORE_GRACE_PERIOD are kept, as their pictures may not be committed yet."""
+    referenced = referenced_digests()
+    pruned = 0
+
+    for digest in list(file_store.digests()):
+        if digest not in referenced and not file_store.is_recent(digest):
+            file_store.delete(digest)
+            pruned += 1
+
+    click.echo(f"Pruned {pruned} unreferenced files.")
+
+def _pictures_to_prune(pictures: list[tuple[int, str | None]], current_id: int, history: int) -> list[int]:
+    """Return the IDs of a user's pictures, newest first, that duplicate a kept picture or are
+    superseded beyond the `history` most recent."""
+    kept_digests = {digest for id, digest in pictures if id == current_id and digest}
+    kept = 0
+    pruned: list[int] = []
+
+    for id, digest in pictures:
+        if id == current_id:
+            continue
+
+        if (digest and digest in kept_digests) or kept >= history:
+            pruned.append(id)
+        else:
+            kept += 1
+
+            if digest:
+                kept_digests.add(digest)
+
+    return pruned
+
+@click.command("prune-profile-pictures")
+@click.option("--history", type = int, default = None, help = "Superseded pictures kept per user. Defaults to PROFILE_PICTURE_HISTORY.")
+@click.option("--batch-size", default = 500, show_default = True, help = "Number of users processed per transaction.")
+@with_appcontext
+def prune_profile_pictures(history: int | None, batch_size: int):
+    """Delete superseded and duplicate profile pictures, and point users without a current picture to their latest one."""
+    history = current_app.config["PROFILE_PICTURE_HISTORY"] if history is None else history
+    after = 0
+    pruned = 0
+    pointed = 0
+
+    while True:
+        user_ids: list[int] = db.session.execute(
+            db.select(ProfilePicture.user_id)
+            .filter(ProfilePicture.user_id > after)
+            .distinct()
+            .order_by(ProfilePicture.user_id)
+            .limit(batch_size)
+        ).scalars().all()
+
+        if not user_ids:
+            break
+
+        after = user_ids[-1]
+        current_ids = dict(db.session.execute(db.select(User.id, User.current_profile_picture_id).filter(User.id.in_(user_ids))).all())
+        pictures: dict[int, list[tuple[int, str | None]]] = {}
+
+        for id, user_id, digest in db.session.execute(
+            db.select(ProfilePicture.id, ProfilePicture.user_id, ProfilePicture.content_hash)
+            .filter(ProfilePicture.user_id.in_(user_ids))
+            .order_by(ProfilePicture.id.desc())
+        ).all():
+            pictures.setdefault(user_id, []).append((id, digest))
+
+        pruned_ids: list[int] = []
+        digests: list[str | None] = []
+
+        for user_id, user_pictures in pictures.items():
+            current_id = current_ids.get(user_id)
+
+            if current_id is None:
+                current_id = user_pictures[0][0]
+                # Unless the user uploaded a picture meanwhile
+                pointed += db.session.execute(
+                    db.update(User)
+                    .filter(User.id == user_id, User.current_profile_picture_id.is_(None))
+                    .values(current_profile_picture_id = current_id)
+                ).rowcount
+
+            digests_by_id = dict(user_pictures)
+            user_pruned_ids = _pictures_to_prune(user_pictures, current_id, history)
+            pruned_ids.extend(user_pruned_ids)
+            digests.extend(digests_by_id[id] for id in user_pruned_ids)
+
+        if pruned_ids:
+            # A picture uploaded again since it was read is current, and kept
+            pruned += db.session.execute(
+                db.delete(ProfilePicture)
+                .filter(ProfilePicture.id.in_(pruned_ids))
+                .filter(~exists().where(User.current_profile_picture_id == ProfilePicture.id))
+            ).rowcount
+
+        db.session.commit()
+        release_blobs(digests)
+
+    click.echo(f"Pruned {pruned} profile pictures, set the current picture of {pointed} users.")
+
+def _init_precompute_worker():
+    global _worker_app
+    from . import create_app
+
+    _worker_app = create_app()
+
+def _precompute_shard(listing_ids: list[int]) -> int:
+    with _worker_app.app_context():
+        return store_recommendations(listing_ids)
+
+def _region_shards(region_precision: int, shard_size: int) -> list[list[int]]:
+    """Group active listings into shards of nearby listings, split by geohash region."""
+    rows = db.session.execute(
+        db.select(Listing.id, Location.geohash)
+        .join(Location, Location.id == Listing.location_id)
+        .filter(Listing.is_complete == False)
+        .order_by(Location.geohash)
+    ).all()
+    regions: dict[str, list[int]] = {}
+
+    for listing_id, geohash in rows:
+        regions.setdefault((geohash or "")[:region_precision], []).append(listing_id)
+
+    return [
+        listing_ids[start:start + shard_size]
+        for listing_ids in regions.values()
+        for start in range(0, len(listing_ids), shard_size)
+    ]
+
+@click.command("precompute-recommendations")
+@click.option("--processes", default = os.cpu_count() or 1, show_default = True, help = "Worker processes, 1 to run in this process.")
+@click.option("--region-precision", default = 3, show_default = True, help = "Geohash precision of the regions listings are sharded by.")
+@click.option("--shard-size", default = 500, show_default = True, help = "Maximum number of listings per shard.")
+@with_appcontext
+def precompute_recommendations(processes: int, region_precision: int, shard_size: int):
+    """Precompute the recommendations of every active listing into the listing_recommendations table."""
+    started_at = time.perf_counter()
+    shards = _region_shards(region_precision, shard_size)
+    stored = 0
+
+    if processes <= 1:
+        for listing_ids in shards:
+            stored += store_recommendations(listing_ids)
+    else:
+        db.engine.dispose() # Workers open their own connections
+
+        with multiprocessing.get_context("spawn").Pool(processes, initializer = _init_precompute_worker) as pool:
+            for count in pool.imap_unordered(_precompute_shard, shards):
+                stored += count
+
+    click.echo(f"Stored recommendations for {stored} listings in {len(shards)} shards ({time.perf_counter() - started_at:.1f}s).")
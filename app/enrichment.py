@@ -0,0 +1,126 @@
+from babel.numbers import get_territory_currencies
+from queue import Queue
+from threading import Lock, Thread, Timer
+import requests
+
+from .extensions import db
+from .models import Listing, Location
+
+PENDING = "pending"
+FAILED = "failed"
+
+def currency_for(country: str) -> str | None:
+    """Return the current currency of a territory, or None if it has none."""
+    currencies = get_territory_currencies(country)
+
+    return currencies[0] if currencies else None
+
+def enrich_location(location_id: int) -> bool | None:
+    """Geocode a location pending enrichment and fill in the currency of its listings.
+
+    Only a geocoder answering without a result marks the location as failed. When the geocoder cannot
+    be reached, or the client rejects the call with its circuit open or rate limit exceeded, the error
+    is raised and the location stays pending for a later attempt.
+
+    Returns:
+        bool | None: Whether a country was found, locations without one are marked as failed.
+            None if the location is not pending enrichment.
+
+    Raises:
+        requests.RequestException: Geocoding is unavailable
+    """
+    location: Location | None = db.session.get(Location, location_id)
+
+    if not location or location.enrichment_status != PENDING:
+        return None
+
+    try:
+        location.country, location.locality = Location.get_location_data(location.latitude, location.longitude)
+    except AttributeError as error:
+        print(f"Error enriching location #{location_id}:", error)
+
+    location.enrichment_status = FAILED if not location.country else None
+
+    if location.country:
+        db.session.execute(
+            db.update(Listing)
+            .filter(Listing.location_id == location_id)
+            .filter(Listing.currency.is_(None))
+            .values(currency = currency_for(location.country))
+        )
+
+    db.session.commit()
+
+    return location.enrichment_status is None
+
+class LocationEnricher:
+    """Background thread geocoding locations stored pending enrichment by `POST /listings`.
+
+    The queue only lives in this process; locations left pending by a restart are picked up by
+    `flask enrich-locations`. Locations that could not be geocoded because geocoding was unavailable
+    are submitted again after `retry_delay` seconds.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._queue: Queue[int] = Queue()
+        self._thread: Thread | None = None
+        self.app = None
+        self.is_deferred = False
+        self.retry_delay = 30
+        self.enriched = 0
+        self.failed = 0
+        self.retried = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.is_deferred = app.config.get("DEFERRED_GEOCODING", self.is_deferred)
+        self.retry_delay = app.config.get("LOCATION_ENRICHMENT_RETRY_DELAY", self.retry_delay)
+
+    def submit(self, location_id: int):
+        self._queue.put(location_id)
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target = self._run, name = "location-enricher", daemon = True)
+                self._thread.start()
+
+    def join(self):
+        """Block until every submitted location has been processed."""
+        self._queue.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                location_id = self._queue.get()
+
+                try:
+                    is_enriched = enrich_location(location_id)
+
+                    if is_enriched:
+                        self.enriched += 1
+                    elif is_enriched is False:
+                        self.failed += 1
+                except requests.RequestException as error:
+                    db.session.rollback()
+                    print(f"Geocoding unavailable for location #{location_id}, retrying in {self.retry_delay}s:", error)
+                    self.retried += 1
+                    retry = Timer(self.retry_delay, self.submit, (location_id,))
+                    retry.daemon = True
+                    retry.start()
+                except Exception as error:
+                    db.session.rollback()
+                    print(f"Error enriching location #{location_id}:", error)
+                    self.failed += 1
+                finally:
+                    db.session.remove()
+                    self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "enriched": self.enriched,
+            "failed": self.failed,
+            "retried": self.retried
+        }
+
+location_enricher = LocationEnricher()
@@ -0,0 +1,163 @@
+from flask import Response, current_app, send_file
+import hashlib
+import os
+import tempfile
+import time
+from typing import Iterator
+
+from .extensions import db
+from .models import ListingPicture, ProfilePicture
+
+def write_file(path: str, data: bytes):
+    """Write a file next to its final path and rename it, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    descriptor, temporary_path = tempfile.mkstemp(dir = os.path.dirname(path), prefix = ".upload-")
+
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        raise
+
+class FileStore:
+    """Content-addressed store of uploaded files under `UPLOAD_FOLDER`/blobs.
+
+    Files are named after the SHA-256 of their content, so identical uploads are stored once and
+    a stored file never changes. They are served from their path, letting the WSGI server use
+    sendfile, or handed off to the front server with `FILE_STORE_OFFLOAD`:
+    "x-accel" (nginx, files exposed as internal location `FILE_STORE_ACCEL_PREFIX`) or
+    "x-sendfile" (Apache/lighttpd).
+    """
+    def __init__(self):
+        self.root: str | None = None
+        self.incoming_folder: str | None = None
+        self.offload: str | None = None
+        self.accel_prefix = "/protected-uploads/blobs/"
+        self.grace_period = 3600
+
+    def init_app(self, app):
+        self.root = os.path.join(app.config["UPLOAD_FOLDER"], "blobs")
+        # Uploads are spooled next to the store, on the same file system, so storing one is a rename
+        self.incoming_folder = os.path.join(self.root, ".incoming")
+        self.offload = app.config.get("FILE_STORE_OFFLOAD") or None
+        self.accel_prefix = app.config.get("FILE_STORE_ACCEL_PREFIX", self.accel_prefix)
+        self.grace_period = app.config.get("FILE_STORE_GRACE_PERIOD", self.grace_period)
+
+        if self.offload == "x-sendfile":
+            app.config["USE_X_SENDFILE"] = True
+
+    def relative_path(self, digest: str) -> str:
+        return os.path.join(digest[:2], digest[2:4], digest)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, self.relative_path(digest))
+
+    def variant_path(self, digest: str, name: str) -> str:
+        """Return the path of a file derived from a stored file, e.g. a thumbnail."""
+        return f"{self.path(digest)}-{name}"
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Mark an already stored file as just stored, so it outlives the grace period of
+        `is_recent` until the picture referring to it is committed. Return False if it is not stored."""
+        try:
+            os.utime(path)
+
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, data: bytes) -> str:
+        """Store a file, unless it is already stored, and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        if not self._touch(path):
+            write_file(path, data)
+
+        return digest
+
+    def put_file(self, path: str, digest: str):
+        """Move a file, hashed as `digest` while it was written, into the store, or delete it if it is already stored."""
+        target = self.path(digest)
+
+        if self._touch(target):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            os.replace(path, target)
+
+    def is_recent(self, digest: str) -> bool:
+        """Whether a file was stored within the grace period, possibly for a picture not committed yet."""
+        try:
+            return time.time() - os.path.getmtime(self.path(digest)) < self.grace_period
+        except FileNotFoundError:
+            return False
+
+    def delete(self, digest: str):
+        """Delete a stored file and the files derived from it."""
+        folder = os.path.dirname(self.path(digest))
+
+        if not os.path.isdir(folder):
+            return
+
+        for filename in os.listdir(folder):
+            if filename == digest or filename.startswith(f"{digest}-"):
+                os.remove(os.path.join(folder, filename))
+
+    def digests(self) -> Iterator[str]:
+        """Yield the digest of every stored file."""
+        if not self.root or not os.path.isdir(self.root):
+            return
+
+        for _, _, filenames in os.walk(self.root):
+            yield from (filename for filename in filenames if not filename.startswith(".") and "-" not in filename)
+
+    def send(self, digest: str, mimetype: str, variant: str | None = None) -> Response:
+        """Respond with a stored file, or with a file derived from it."""
+        path = self.variant_path(digest, variant) if variant else self.path(digest)
+
+        if self.offload == "x-accel":
+            response = current_app.response_class(mimetype = mimetype)
+            response.headers["X-Accel-Redirect"] = self.accel_prefix + os.path.relpath(path, self.root).replace(os.sep, "/")
+
+            return response
+
+        # The caller sets the content hash as ETag, instead of one derived from the file's modification time
+        return send_file(path, mimetype, etag = False)
+
+file_store = FileStore()
+
+def referenced_digests(among: set[str] | None = None) -> set[str]:
+    """Return the digests pictures refer to, optionally only those among the given ones."""
+    digests: set[str] = set()
+
+    for model in [ListingPicture, ProfilePicture]:
+        query = db.select(model.content_hash).filter(model.content_hash.is_not(None)).distinct()
+
+        if among is not None:
+            query = query.filter(model.content_hash.in_(among))
+
+        digests.update(db.session.execute(query).scalars())
+
+    return digests
+
+def release_blobs(digests: list[str | None]):
+    """Delete the stored files no picture refers to anymore, unless they were just stored again for
+    a picture being uploaded. Call after committing the deletion of their pictures."""
+    digests = {digest for digest in digests if digest}
+
+    if not digests:
+        return
+
+    for digest in digests - referenced_digests(digests):
+        if not file_store.is_recent(digest):
+            file_store.delete(digest)
@@ -0,0 +1,163 @@
+import math
+import numpy as np
+from sqlalchemy import and_, false, or_
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9 # ~4.8 m x 4.8 m cells
+MAX_COVERING_CELLS = 32
+EARTH_RADIUS = 6371008.8 # mean radius in metres
+RADIUS_MARGIN = 1.01 # covers the gap between spherical and ellipsoidal distances
+
+def _cell_counts(precision: int) -> tuple[int, int]:
+    """Return the number of geohash rows (latitude) and columns (longitude) at a precision."""
+    bits = 5 * precision
+
+    return 2 ** (bits // 2), 2 ** (bits - bits // 2)
+
+def _encode_cell(row: int, column: int, precision: int) -> str:
+    """Interleave the bits of a cell's row and column indices into a geohash, longitude first."""
+    bits = 5 * precision
+    latitude_bits = bits // 2
+    longitude_bits = bits - latitude_bits
+    value = 0
+
+    for bit in range(bits):
+        if bit % 2 == 0:
+            value = (value << 1) | ((column >> (longitude_bits - 1 - bit // 2)) & 1)
+        else:
+            value = (value << 1) | ((row >> (latitude_bits - 1 - bit // 2)) & 1)
+
+    return "".join(GEOHASH_ALPHABET[(value >> shift) & 31] for shift in range(bits - 5, -1, -5))
+
+def _row(latitude: float, rows: int) -> int:
+    return min(int((latitude + 90) / 180 * rows), rows - 1)
+
+def _column(longitude: float, columns: int) -> int:
+    return min(int((longitude + 180) / 360 * columns), columns - 1)
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a geohash."""
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        raise ValueError("Latitude and longitude must fall within +/- 90 and +/- 180 respectively.")
+
+    rows, columns = _cell_counts(precision)
+
+    return _encode_cell(_row(latitude, rows), _column(longitude, columns), precision)
+
+def bounding_box(latitude: float, longitude: float, radius: float) -> tuple[float, float, list[tuple[float, float]]]:
+    """Return the latitude bounds and longitude ranges enclosing a radius (in metres) around a point.
+
+    Longitude ranges are split in two when the box crosses the antimeridian, and span the whole
+    globe when the radius reaches a pole.
+    """
+    angular_radius = radius * RADIUS_MARGIN / EARTH_RADIUS
+    angular_radius_degrees = math.degrees(angular_radius)
+    lat_min = latitude - angular_radius_degrees
+    lat_max = latitude + angular_radius_degrees
+
+    if lat_min <= -90 or lat_max >= 90:
+        return max(lat_min, -90), min(lat_max, 90), [(-180, 180)]
+
+    longitude_reach = math.sin(angular_radius) / math.cos(math.radians(latitude))
+
+    if longitude_reach >= 1:
+        return lat_min, lat_max, [(-180, 180)]
+
+    longitude_delta = math.degrees(math.asin(longitude_reach))
+    lon_min = longitude - longitude_delta
+    lon_max = longitude + longitude_delta
+
+    if lon_min < -180:
+        return lat_min, lat_max, [(lon_min + 360, 180), (-180, lon_max)]
+
+    if lon_max > 180:
+        return lat_min, lat_max, [(lon_min, 180), (-180, lon_max - 360)]
+
+    return lat_min, lat_max, [(lon_min, lon_max)]
+
+def haversine(latitude: float, longitude: float, latitudes, longitudes) -> np.ndarray:
+    """Return the great-circle distances (in metres) from a point (in degrees) to arrays of points."""
+    latitude = math.radians(latitude)
+    latitudes = np.radians(np.asarray(latitudes, dtype = float))
+    longitude_deltas = np.radians(np.asarray(longitudes, dtype = float) - longitude)
+
+    a = np.sin((latitudes - latitude) / 2) ** 2 + math.cos(latitude) * np.cos(latitudes) * np.sin(longitude_deltas / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """Convert coordinates in degrees, or arrays of them, to points on the unit sphere along the last axis."""
+    latitudes = np.radians(np.asarray(latitudes, dtype = float))
+    longitudes = np.radians(np.asarray(longitudes, dtype = float))
+    cos_latitudes = np.cos(latitudes)
+
+    return np.stack([cos_latitudes * np.cos(longitudes), cos_latitudes * np.sin(longitudes), np.sin(latitudes)], axis = -1)
+
+def unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    """Convert a coordinate in degrees to a point on the unit sphere."""
+    x, y, z = unit_vectors(latitude, longitude).tolist()
+
+    return x, y, z
+
+def chord_length(radius: float) -> float:
+    """Convert a great-circle distance in metres to the straight-line distance between unit-sphere points."""
+    return 2 * math.sin(min(radius / EARTH_RADIUS, math.pi) / 2)
+
+def chord_to_metres(chord):
+    """Convert straight-line distances between unit-sphere points, a float or an array, to great-circle distances in metres."""
+    return 2 * np.arcsin(np.clip(chord / 2, 0, 1)) * EARTH_RADIUS
+
+def _longitude_ranges(west: float, east: float) -> list[tuple[float, float]]:
+    return [(west, east)] if west <= east else [(west, 180), (-180, east)]
+
+def cell_count(south: float, west: float, north: float, east: float, precision: int) -> int:
+    """Return the number of geohash cells of a precision overlapping a box, see `box_cells`."""
+    rows, columns = _cell_counts(precision)
+    column_count = sum(_column(lon_max, columns) - _column(lon_min, columns) + 1 for lon_min, lon_max in _longitude_ranges(west, east))
+
+    return (_row(north, rows) - _row(south, rows) + 1) * column_count
+
+def box_cells(south: float, west: float, north: float, east: float, precision: int) -> list[str]:
+    """Return the geohashes of the cells of a precision overlapping a box, which crosses the antimeridian when `west` > `east`."""
+    rows, columns = _cell_counts(precision)
+
+    return sorted({
+        _encode_cell(row, column, precision)
+        for row in range(_row(south, rows), _row(north, rows) + 1)
+        for lon_min, lon_max in _longitude_ranges(west, east)
+        for column in range(_column(lon_min, columns), _column(lon_max, columns) + 1)
+    })
+
+def covering_cells(latitude: float, longitude: float, radius: float) -> list[str]:
+    """Return the geohash prefixes of the cells covering a radius (in metres) around a point.
+
+    Uses the finest precision at which the covering stays within `MAX_COVERING_CELLS` cells.
+    """
+    lat_min, lat_max, longitude_ranges = bounding_box(latitude, longitude, radius)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        rows, columns = _cell_counts(precision)
+        row_range = range(_row(lat_min, rows), _row(lat_max, rows) + 1)
+        column_ranges = [range(_column(lon_min, columns), _column(lon_max, columns) + 1) for lon_min, lon_max in longitude_ranges]
+
+        if len(row_range) * sum(len(column_range) for column_range in column_ranges) <= MAX_COVERING_CELLS:
+            break
+
+    cells = {
+        _encode_cell(row, column, precision)
+        for row in row_range
+        for column_range in column_ranges
+        for column in column_range
+    }
+
+    return sorted(cells)
+
+def cells_filter(column, cells: list[str]):
+    """Build a filter matching geohashes that start with any of the given prefixes.
+
+    Each prefix becomes a range comparison so the filter can use an index on `column`.
+    """
+    if not cells:
+        return false()
+
+    return or_(*[and_(column >= cell, column < cell + "~") for cell in cells])
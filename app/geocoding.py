@@ -0,0 +1,217 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+import requests
+from sqlalchemy.exc import IntegrityError
+
+from config import GOOGLE_API_KEY
+from .extensions import db
+from .geocoding_client import GeocodingClient
+from .models import GeocodeCacheEntry
+from .offline_geocoder import OfflineReverseGeocoder
+
+GOOGLE_GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+def check_google_status(data: dict):
+    """Raise for the errors Google reports with an HTTP 200, e.g. OVER_QUERY_LIMIT or REQUEST_DENIED,
+    so the geocoding client counts them as failures.
+
+    Raises:
+        requests.HTTPError: Status other than OK and ZERO_RESULTS
+    """
+    status = data.get("status")
+
+    if status not in ["OK", "ZERO_RESULTS"]:
+        raise requests.HTTPError(f"Geocoding failed with status {status}. {data.get('error_message', '')}".strip())
+
+class GoogleGeocodingBackend:
+    """Reverse geocoding through the Google Geocoding API."""
+    def __init__(self, app = None):
+        self.api_key = app.config.get("GOOGLE_API_KEY", GOOGLE_API_KEY) if app else GOOGLE_API_KEY
+        self.client = GeocodingClient.from_config(app.config) if app else GeocodingClient()
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        data = self.client.get_json(GOOGLE_GEOCODING_URL, {"latlng": f"{latitude},{longitude}", "key": self.api_key}, check_google_status)
+
+        if data["status"] == "ZERO_RESULTS" or not len(data["results"]):
+            raise AttributeError("No results for these coordinates.")
+
+        country = None
+        locality = None
+
+        for result in data["results"][0]["address_components"]:
+            if "country" in result["types"]:
+                country: str = result["short_name"]
+
+            if "locality" in result["types"]:
+                locality: str = result["long_name"]
+
+        if not country and not locality:
+            raise AttributeError("Country and locality could not be found.")
+
+        return country, locality
+
+class StubGeocodingBackend:
+    """Network-free backend answering every coordinate with the same country and locality, for tests and benchmarks."""
+    def __init__(self, app = None):
+        self.country = app.config.get("GEOCODING_STUB_COUNTRY", "US") if app else "US"
+        self.locality = app.config.get("GEOCODING_STUB_LOCALITY") if app else None
+        self.calls = 0
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        self.calls += 1
+
+        return self.country, self.locality
+
+class OfflineGeocodingBackend:
+    """Reverse geocoding from local country boundaries and populated places.
+
+    The refinement backend (`GEOCODING_REFINE_BACKEND`) is only called for coordinates with no
+    locality nearby, or for every coordinate when the offline data is not installed.
+    """
+    def __init__(self, app = None):
+        self.engine = OfflineReverseGeocoder(
+            app.config.get("GEOCODER_DATA_FOLDER") if app else None,
+            app.config.get("OFFLINE_GEOCODER_LOCALITY_RADIUS", 25) if app else 25
+        )
+        refine_backend = app.config.get("GEOCODING_REFINE_BACKEND") if app else None
+        self.refine_backend = GEOCODING_BACKENDS[refine_backend](app) if refine_backend else None
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        if not self.engine.is_available:
+            if self.refine_backend:
+                return self.refine_backend.reverse_geocode(latitude, longitude)
+
+            raise AttributeError("Offline geocoding data is not installed.")
+
+        country, locality = self.engine.reverse_geocode(latitude, longitude)
+
+        if locality is None and self.refine_backend:
+            try:
+                refined_country, refined_locality = self.refine_backend.reverse_geocode(latitude, longitude)
+
+                return refined_country or country, refined_locality
+            except (requests.RequestException, AttributeError) as error:
+                print("Error refining offline geocoding result:", error)
+
+        if not country and not locality:
+            raise AttributeError("Country and locality could not be found.")
+
+        return country, locality
+
+GEOCODING_BACKENDS = {
+    "google": GoogleGeocodingBackend,
+    "offline": OfflineGeocodingBackend,
+    "stub": StubGeocodingBackend
+}
+
+class Geocoder:
+    """Reverse geocoder caching results by quantized coordinates.
+
+    Lookups go through an in-memory LRU, then the `geocode_cache` table, and only then the
+    configured backend, so repeated locations in the same neighbourhood cost no network call.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._entries: OrderedDict[tuple[int, int], tuple[str | None, str | None]] = OrderedDict()
+        self.backend = GoogleGeocodingBackend()
+        self.precision = 3
+        self.max_size = 4096
+        self.hits = 0
+        self.database_hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        backend = app.config.get("GEOCODING_BACKEND", "google")
+        self.backend = GEOCODING_BACKENDS[backend](app) if isinstance(backend, str) else backend
+        self.precision = app.config.get("GEOCODE_CACHE_PRECISION", self.precision)
+        self.max_size = app.config.get("GEOCODE_CACHE_SIZE", self.max_size)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.database_hits = 0
+            self.misses = 0
+
+    def key(self, latitude: float, longitude: float) -> tuple[int, int]:
+        """Quantize coordinates to `precision` decimal places (3 is roughly 100 m)."""
+        scale = 10 ** self.precision
+
+        return round(latitude * scale), round(longitude * scale)
+
+    def _remember(self, key: tuple[int, int], value: tuple[str | None, str | None]):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        """Return the country code and locality of a coordinate.
+
+        Raises:
+            requests.RequestException: Backend request failed, or the geocoding client is unavailable
+            AttributeError: Backend found no country or locality
+        """
+        key = self.key(latitude, longitude)
+
+        with self._lock:
+            value = self._entries.get(key)
+
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+                return value
+
+        entry: GeocodeCacheEntry | None = db.session.get(GeocodeCacheEntry, (*key, self.precision))
+
+        if entry:
+            self.database_hits += 1
+            value = (entry.country, entry.locality)
+            self._remember(key, value)
+
+            return value
+
+        self.misses += 1
+        value = self.backend.reverse_geocode(latitude, longitude)
+        self._remember(key, value)
+
+        try:
+            # Savepoint, so a concurrent insert of the same key cannot fail the caller's transaction
+            with db.session.begin_nested():
+                db.session.add(GeocodeCacheEntry(
+                    latitude_key = key[0],
+                    longitude_key = key[1],
+                    precision = self.precision,
+                    country = value[0],
+                    locality = value[1],
+                    created_at = datetime.now(timezone.utc)
+                ))
+        except IntegrityError:
+            pass
+
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "precision": self.precision,
+            "hits": self.hits,
+            "databaseHits": self.database_hits,
+            "misses": self.misses,
+            "client": self.client.stats() if self.client else None
+        }
+
+    @property
+    def client(self) -> GeocodingClient | None:
+        """HTTP client of the backend, or of the backend an offline backend refines with."""
+        backend = getattr(self.backend, "refine_backend", None) or self.backend
+
+        return getattr(backend, "client", None)
+
+geocoder = Geocoder()
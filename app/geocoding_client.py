@@ -0,0 +1,206 @@
+from threading import BoundedSemaphore, Lock
+import time
+from typing import Callable
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class GeocodingUnavailableError(requests.RequestException):
+    """Raised without contacting the upstream, when the circuit is open or the client is saturated."""
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens."""
+    def __init__(self, rate: float, capacity: float):
+        self._lock = Lock()
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def acquire(self, timeout: float) -> bool:
+        """Take a token, waiting at most `timeout` seconds for one."""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+
+                    return True
+
+                wait = (1 - self._tokens) / self.rate
+
+            if now + wait > deadline:
+                return False
+
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, then lets a single trial call through
+    every `reset_timeout` seconds until one succeeds."""
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._lock = Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.is_trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            if self.is_trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+
+            self.is_trial_running = True
+
+            return True
+
+    def cancel_trial(self):
+        """Release the trial slot taken by `allow` for a call that was not made."""
+        with self._lock:
+            self.is_trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.is_trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self.is_trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+            self.is_trial_running = False
+
+class GeocodingClient:
+    """HTTP client shared by every geocoding request of the process.
+
+    Requests reuse pooled connections, have strict timeouts and a small retry budget for
+    connection errors, and are limited in concurrency and rate. After repeated failures the
+    circuit opens and calls fail fast with `GeocodingUnavailableError` instead of waiting on a
+    degraded upstream.
+    """
+    def __init__(
+        self,
+        timeout: tuple[float, float] = (2, 5),
+        max_concurrency: int = 8,
+        rate_limit: float = 40,
+        retries: int = 1,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30
+    ):
+        self.timeout = timeout
+        self._semaphore = BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_limit, max(1, rate_limit))
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections = 1,
+            pool_maxsize = max_concurrency,
+            max_retries = Retry(total = retries, connect = retries, read = 0, status = 0, backoff_factor = 0.1)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._counter_lock = Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> "GeocodingClient":
+        return cls(
+            timeout = (config.get("GEOCODING_CONNECT_TIMEOUT", 2), config.get("GEOCODING_READ_TIMEOUT", 5)),
+            max_concurrency = config.get("GEOCODING_MAX_CONCURRENCY", 8),
+            rate_limit = config.get("GEOCODING_RATE_LIMIT", 40),
+            retries = config.get("GEOCODING_RETRIES", 1),
+            failure_threshold = config.get("GEOCODING_CIRCUIT_FAILURES", 5),
+            reset_timeout = config.get("GEOCODING_CIRCUIT_RESET", 30)
+        )
+
+    def _reject(self, reason: str):
+        with self._counter_lock:
+            self.rejected += 1
+
+        raise GeocodingUnavailableError(reason)
+
+    def get_json(self, url: str, params: dict, check: Callable[[dict], None] | None = None) -> dict:
+        """GET a JSON document.
+
+        Args:
+            url (str): Endpoint URL
+            params (dict): Query parameters
+            check (Callable[[dict], None] | None, optional): Raises `requests.RequestException` for an
+                error reported in the document, which then counts as a failure. Defaults to None.
+
+        Raises:
+            GeocodingUnavailableError: Circuit open, or no request slot or rate limit token became available within the connect timeout
+            requests.RequestException: Request failed, timed out or returned an error status
+        """
+        if not self.breaker.allow():
+            self._reject("Geocoding circuit is open.")
+
+        if not self._semaphore.acquire(timeout = self.timeout[0]):
+            self.breaker.cancel_trial()
+            self._reject("Too many concurrent geocoding requests.")
+
+        try:
+            if not self._bucket.acquire(self.timeout[0]):
+                self.breaker.cancel_trial()
+                self._reject("Geocoding rate limit exceeded.")
+
+            started_at = time.perf_counter()
+
+            try:
+                response = self.session.get(url, params = params, timeout = self.timeout)
+                response.raise_for_status()
+                data = response.json()
+
+                if check:
+                    check(data)
+            except (requests.RequestException, ValueError):
+                self._record(time.perf_counter() - started_at, is_error = True)
+                self.breaker.record_failure()
+                raise
+
+            self._record(time.perf_counter() - started_at, is_error = False)
+            self.breaker.record_success()
+
+            return data
+        finally:
+            self._semaphore.release()
+
+    def _record(self, latency: float, is_error: bool):
+        with self._counter_lock:
+            self.calls += 1
+            self.errors += is_error
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "meanLatency": self.total_latency / self.calls if self.calls else None,
+            "maxLatency": self.max_latency,
+            "circuit": self.breaker.state
+        }
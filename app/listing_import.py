@@ -0,0 +1,255 @@
+import csv
+from dataclasses import dataclass, field
+from datetime import date, datetime
+import json
+import os
+import time
+from typing import Iterable, Iterator
+import requests
+
+from .enrichment import FAILED, PENDING, currency_for
+from .extensions import db
+from .geocoding import geocoder
+from .models import Listing, Location, User
+from .utilities import string_to_bool
+
+CATEGORIES = ["short-term", "long-term", "hosting"]
+MAX_REPORTED_ERRORS = 20
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    invalid: int = 0
+    failed: int = 0
+    locations_created: int = 0
+    locations_reused: int = 0
+    geocoded: int = 0
+    seconds: float = 0.0
+    errors: list[str] = field(default_factory = list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add_error(self, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+def read_rows(path: str, format: str | None = None) -> Iterator[dict | str]:
+    """Stream the rows of a CSV file with a header line, or of an NDJSON file with one object per line.
+    The format defaults to the file extension.
+
+    NDJSON lines are yielded undecoded, so `import_listings` reports a malformed line as an invalid row
+    instead of the whole import failing."""
+    format = format or ("ndjson" if os.path.splitext(path)[1].lower() in [".ndjson", ".jsonl"] else "csv")
+
+    with open(path, encoding = "utf-8", newline = "") as file:
+        if format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield line
+
+def _boolean(value) -> bool:
+    return value if isinstance(value, bool) else string_to_bool(str(value))
+
+def _date(value) -> date | None:
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+def parse_row(row: dict | str) -> dict:
+    """Validate a row like `POST /listings` validates its form, except that past start dates are accepted.
+
+    Args:
+        row (dict | str): CSV row, or NDJSON line decoded here
+
+    Raises:
+        ValueError: Malformed JSON, a row that is not an object, or a missing or invalid value
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+
+    if not isinstance(row, dict):
+        raise ValueError("Row is not a JSON object.")
+
+    missing = [key for key in ["user_id", "latitude", "longitude", "radius", "category", "start_date", "description"] if row.get(key) in [None, ""]]
+
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}.")
+
+    latitude = float(row["latitude"])
+    longitude = float(row["longitude"])
+
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        raise ValueError("Invalid coordinates.")
+
+    radius = int(row["radius"])
+
+    if radius <= 0:
+        raise ValueError("Radius must be positive.")
+
+    if row["category"] not in CATEGORIES:
+        raise ValueError("Invalid listing category.")
+
+    nightly_budget = int(row["nightly_budget"]) if row.get("nightly_budget") not in [None, ""] else None
+
+    if nightly_budget is not None and nightly_budget <= 0:
+        raise ValueError("Budget must be positive.")
+
+    start_date = _date(row["start_date"])
+    end_date = _date(row.get("end_date"))
+
+    if end_date and end_date <= start_date:
+        raise ValueError("End date must be after start date.")
+
+    return {
+        "user_id": int(row["user_id"]),
+        "latitude": latitude,
+        "longitude": longitude,
+        "location_name": row.get("location_name") or None,
+        "radius": radius,
+        "category": row["category"],
+        "nightly_budget": nightly_budget,
+        "start_date": start_date,
+        "end_date": end_date,
+        "dates_are_approximate": _boolean(row.get("dates_are_approximate", True)),
+        "prefers_same_gender": _boolean(row.get("prefers_same_gender", False)),
+        "description": row["description"]
+    }
+
+def _locations_by_key(rows: list[dict], defer_geocoding: bool, report: ImportReport) -> dict[str, tuple[int, str | None]]:
+    """Return the ID and country of the location of every row by snap key, inserting the missing ones."""
+    points: dict[str, dict] = {}
+
+    for row in rows:
+        row["snap_key"] = Location.snap_key_for(row["latitude"], row["longitude"], row["location_name"])
+        points.setdefault(row["snap_key"], row)
+
+    locations = {
+        key: (id, country)
+        for id, key, country in db.session.execute(
+            db.select(Location.id, Location.snap_key, Location.country)
+            .filter(Location.snap_key.in_(points.keys()))
+        ).all()
+    }
+    report.locations_reused += len(locations)
+    new_locations: list[dict] = []
+
+    for key, row in points.items():
+        if key in locations:
+            continue
+
+        country = None
+        locality = None
+        status = PENDING
+
+        if not defer_geocoding:
+            try:
+                country, locality = geocoder.reverse_geocode(row["latitude"], row["longitude"])
+                report.geocoded += 1
+            except (requests.RequestException, AttributeError) as error:
+                report.add_error(f"Geocoding {row['latitude']}, {row['longitude']} failed: {error}")
+
+            # Like enrichment, locations without a country are marked for `flask enrich-locations --retry-failed`
+            status = FAILED if not country else None
+
+        new_locations.append({
+            "name": row["location_name"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "country": country,
+            "locality": locality,
+            "enrichment_status": status,
+            "snap_key": key,
+            **Location.spatial_columns(row["latitude"], row["longitude"])
+        })
+
+    if new_locations:
+        inserted = db.session.execute(
+            db.insert(Location).returning(Location.id, Location.snap_key, Location.country, sort_by_parameter_order = True),
+            new_locations
+        ).all()
+        locations.update({key: (id, country) for id, key, country in inserted})
+        report.locations_created += len(inserted)
+
+    return locations
+
+def _import_chunk(rows: list[dict], defer_geocoding: bool, report: ImportReport):
+    user_ids = set(db.session.execute(
+        db.select(User.id)
+        .filter(User.id.in_({row["user_id"] for row in rows}))
+    ).scalars())
+    valid_rows = [row for row in rows if row["user_id"] in user_ids]
+
+    for row in rows:
+        if row["user_id"] not in user_ids:
+            report.invalid += 1
+            report.add_error(f"Row {row['line']}: user #{row['user_id']} not found.")
+
+    if not valid_rows:
+        return
+
+    try:
+        locations = _locations_by_key(valid_rows, defer_geocoding, report)
+        currencies: dict[str, str | None] = {}
+        listings: list[dict] = []
+
+        for row in valid_rows:
+            location_id, country = locations[row["snap_key"]]
+
+            if country and country not in currencies:
+                currencies[country] = currency_for(country)
+
+            listings.append({
+                "user_id": row["user_id"],
+                "location_id": location_id,
+                "category": row["category"],
+                "start_date": row["start_date"],
+                "end_date": row["end_date"],
+                "dates_are_approximate": row["dates_are_approximate"],
+                "nightly_budget": row["nightly_budget"],
+                "currency": currencies.get(country),
+                "description": row["description"],
+                "prefers_same_gender": row["prefers_same_gender"],
+                "radius": row["radius"],
+                "is_complete": False
+            })
+
+        db.session.execute(db.insert(Listing), listings)
+        db.session.commit()
+        report.imported += len(listings)
+    except Exception as error:
+        print(f"Error importing rows {valid_rows[0]['line']} to {valid_rows[-1]['line']}:", error)
+        db.session.rollback()
+        report.failed += len(valid_rows)
+
+def import_listings(rows: Iterable[dict | str], batch_size: int = 1000, defer_geocoding: bool = False) -> ImportReport:
+    """Import listings in transactions of `batch_size` rows, sharing one location per snap key.
+
+    Each chunk validates its rows, geocodes each new location once through the geocoder's cache (or leaves
+    it pending enrichment), and inserts locations and listings with one multi-row insert each.
+    """
+    report = ImportReport()
+    started_at = time.perf_counter()
+    chunk: list[dict] = []
+
+    for line, row in enumerate(rows, start = 1):
+        report.rows += 1
+
+        try:
+            chunk.append({"line": line, **parse_row(row)})
+        except (KeyError, TypeError, ValueError) as error:
+            report.invalid += 1
+            report.add_error(f"Row {line}: {error}")
+
+        if len(chunk) >= batch_size:
+            _import_chunk(chunk, defer_geocoding, report)
+            chunk = []
+
+    if chunk:
+        _import_chunk(chunk, defer_geocoding, report)
+
+    report.seconds = time.perf_counter() - started_at
+
+    return report
@@ -0,0 +1,81 @@
+import math
+from sqlalchemy import func
+
+from .extensions import db
+from .geocells import GEOHASH_PRECISION, box_cells, cell_count, cells_filter
+from .models import Listing, Location
+from .ttl_cache import MISSING, TtlCache
+
+MAX_CLUSTER_CELLS = 1024 # cells per viewport, coarser cells are used beyond this
+QUERY_CHUNK_SIZE = 200 # cells aggregated per query
+
+# Aggregates per (precision, geohash cell), None for cells without active listings
+cluster_cache: TtlCache[tuple[int, str], dict | None] = TtlCache(max_size = 16384, ttl = 60, config_prefix = "MAP_CLUSTER_CACHE")
+
+def zoom_precision(zoom: int) -> int:
+    """Return the geohash precision giving cells about a quarter of a map tile wide at a zoom level."""
+    # Precision p has ceil(5p / 2) longitude bits, a tile at zoom z spans 1 / 2^z of the longitudes
+    return max(1, min(GEOHASH_PRECISION, math.ceil(2 * (zoom + 2) / 5)))
+
+def _aggregate(precision: int, cells: list[str]) -> dict[str, dict]:
+    """Count the active listings of each cell by category, with the centroid of their locations."""
+    prefix = func.substr(Location.geohash, 1, precision)
+    rows = db.session.execute(
+        db.select(prefix, Listing.category, func.count(Listing.id), func.avg(Location.latitude), func.avg(Location.longitude))
+        .join(Location, Location.id == Listing.location_id)
+        .filter(Listing.is_complete == False)
+        .filter(cells_filter(Location.geohash, cells))
+        .group_by(prefix, Listing.category)
+    ).all()
+    clusters: dict[str, dict] = {}
+
+    for cell, category, count, latitude, longitude in rows:
+        cluster = clusters.setdefault(cell, {"cell": cell, "count": 0, "centroid": {"lat": 0.0, "lng": 0.0}, "categories": {}})
+        cluster["count"] += count
+        cluster["categories"][category] = count
+        # Running sums, divided by the count below
+        cluster["centroid"]["lat"] += latitude * count
+        cluster["centroid"]["lng"] += longitude * count
+
+    for cluster in clusters.values():
+        cluster["centroid"]["lat"] /= cluster["count"]
+        cluster["centroid"]["lng"] /= cluster["count"]
+
+    return clusters
+
+def viewport_clusters(south: float, west: float, north: float, east: float, zoom: int) -> tuple[int, list[dict]]:
+    """Return the precision and the non-empty clusters of the geohash cells overlapping a viewport.
+
+    Cells are aggregated once and cached, so panning only queries the cells that came into view.
+    """
+    precision = zoom_precision(zoom)
+
+    while precision > 1 and cell_count(south, west, north, east, precision) > MAX_CLUSTER_CELLS:
+        precision -= 1
+
+    cells = box_cells(south, west, north, east, precision)
+    clusters: dict[str, dict | None] = {}
+    missing: list[str] = []
+
+    for cell in cells:
+        cluster = cluster_cache.get((precision, cell))
+
+        if cluster is MISSING:
+            missing.append(cell)
+        else:
+            clusters[cell] = cluster
+
+    for start in range(0, len(missing), QUERY_CHUNK_SIZE):
+        chunk = missing[start:start + QUERY_CHUNK_SIZE]
+        aggregated = _aggregate(precision, chunk)
+
+        for cell in chunk:
+            clusters[cell] = aggregated.get(cell)
+            cluster_cache.set((precision, cell), clusters[cell])
+
+    return precision, [clusters[cell] for cell in cells if clusters[cell]]
+
+def invalidate_clusters(geohash: str | None):
+    """Drop the cached clusters of every cell containing a location, after a listing there is created, deleted or completed."""
+    if geohash:
+        cluster_cache.invalidate([(precision, geohash[:precision]) for precision in range(1, GEOHASH_PRECISION + 1)])
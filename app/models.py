@@ -1,18 +1,22 @@
 from .extensions import db
-from config import GOOGLE_API_KEY
+from .geocells import cells_filter, chord_length, covering_cells, encode, unit_vector
+from .recommendation_cache import recommendation_cache
+from .swipe_deck import discard_swiped
 from datetime import date, datetime, timezone
+from flask import current_app
 from flask_login import UserMixin
 from geodistpy import geodist
-import math
 import requests
-from sqlalchemy import or_, text
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.exc import IntegrityError
 from typing import Optional
 
 # Association table for listing tags
 listing_tags = db.Table(
     'listing_tags',
     db.Column('listing_id', db.Integer, db.ForeignKey('listings.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_listing_tags_tag_id', 'tag_id')
 )
 
 # Association table for user tags
@@ -44,6 +48,10 @@ class Swipe(db.Model):
     is_like: bool = db.Column(db.Boolean, nullable=False)
     timestamp: datetime = db.Column(db.DateTime, default=datetime.now(timezone.utc))
 
+    __table_args__ = (
+        db.Index('ix_swipes_swiped_by_swiped_on', 'swiped_by_listing_id', 'swiped_on_listing_id'),
+    )
+
     swiped_by_listing = db.relationship(
         'Listing',
         foreign_keys=[swiped_by_listing_id],
@@ -92,6 +100,8 @@ class Swipe(db.Model):
             )
             db.session.add(new_swipe)
             db.session.commit()
+            recommendation_cache.invalidate([swiped_by_listing.id])
+            discard_swiped(swiped_by_listing.id, swiped_on_listing.id)
         except Exception as error:
             db.session.rollback()
             
@@ -189,16 +199,47 @@ class Match(db.Model):
             
         return None
 
-class ListingPicture(db.Model):
+class PictureMetadata:
+    """Projection of picture metadata, for queries that must not load picture data."""
+    @classmethod
+    def select_metadata(cls):
+        return db.select(cls.id, cls.image_mimetype, cls.image_size, cls.content_hash, cls.timestamp)
+    
+    @staticmethod
+    def metadata_to_dict(row) -> dict:
+        return {
+            "id": row.id,
+            "mimetype": row.image_mimetype,
+            "size": row.image_size,
+            "hash": row.content_hash,
+            "timestamp": row.timestamp
+        }
+
+class ListingPicture(db.Model, PictureMetadata):
     __tablename__ = "listing_pictures"
     id: int = db.Column(db.Integer, primary_key = True)
     listing_id: int = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete = "CASCADE"), nullable = False)
-    image_data: bytes = db.Column(db.LargeBinary, nullable = False)
+    # Deferred, so loading a picture never loads its data unless accessed; only kept until `flask migrate-blobs`
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable = True))
+    content_hash: Optional[str] = db.Column(db.String(64), nullable = True, index = True) # SHA-256 of the file in the file store
+    image_size: Optional[int] = db.Column(db.Integer, nullable = True) # bytes
     image_mimetype: str = db.Column(db.String(255), nullable = False)
     timestamp: datetime = db.Column(db.DateTime, default = datetime.now(timezone.utc))
 
     listing = db.relationship("Listing", back_populates = "pictures")
 
+    @classmethod
+    def select_covers(cls, listing_ids: list[int]):
+        """Select the listing ID, ID, content hash and mimetype of the first stored picture of each listing."""
+        first_ids = (
+            db.select(func.min(cls.id))
+            .filter(cls.listing_id.in_(listing_ids))
+            .filter(cls.content_hash.is_not(None))
+            .group_by(cls.listing_id)
+        )
+
+        return db.select(cls.listing_id, cls.id, cls.content_hash, cls.image_mimetype).filter(cls.id.in_(first_ids))
+
 class Listing(db.Model):
     __tablename__ = 'listings'
     id: int = db.Column(db.Integer, primary_key=True)
@@ -221,6 +262,7 @@ class Listing(db.Model):
     tags = db.relationship('Tag', secondary=listing_tags, back_populates='listings')
     location = db.relationship("Location", back_populates = "listings")
     pictures = db.relationship("ListingPicture", back_populates = "listing", cascade="all, delete-orphan", lazy = "dynamic")
+    stored_recommendations = db.relationship("ListingRecommendation", back_populates = "listing", cascade = "all, delete-orphan", uselist = False)
     
     def to_dict(self, for_javascript: bool = True):
         return {
@@ -255,6 +297,17 @@ class Listing(db.Model):
             "timestamp": self.timestamp
         }
 
+class ListingRecommendation(db.Model):
+    """Recommendations of a listing precomputed by the `precompute-recommendations` command."""
+    __tablename__ = "listing_recommendations"
+    listing_id: int = db.Column(db.Integer, db.ForeignKey("listings.id", ondelete = "CASCADE"), primary_key = True)
+    listing_ids: list[int] = db.Column(db.JSON, nullable = False)
+    scores: list[float] = db.Column(db.JSON, nullable = False)
+    computed_at: datetime = db.Column(db.DateTime, nullable = False, index = True)
+    is_stale: bool = db.Column(db.Boolean, nullable = False, default = False)
+
+    listing = db.relationship("Listing", back_populates = "stored_recommendations")
+
 class Tag(db.Model):
     __tablename__ = 'tags'
     id: int = db.Column(db.Integer, primary_key=True)
@@ -264,16 +317,19 @@ class Tag(db.Model):
     listings = db.relationship('Listing', secondary=listing_tags, back_populates='tags')
     users = db.relationship('User', secondary=user_tags, back_populates='tags')
 
-class ProfilePicture(db.Model):
+class ProfilePicture(db.Model, PictureMetadata):
     __tablename__ = 'profile_pictures'
     id: int = db.Column(db.Integer, primary_key=True)
-    user_id: int = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    image_data: bytes = db.Column(db.LargeBinary, nullable=False)
+    user_id: int = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # Deferred, so loading a picture never loads its data unless accessed; only kept until `flask migrate-blobs`
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    content_hash: Optional[str] = db.Column(db.String(64), nullable=True, index=True) # SHA-256 of the file in the file store
+    image_size: Optional[int] = db.Column(db.Integer, nullable=True) # bytes
     image_mimetype: str = db.Column(db.String(255), nullable=False)
-    timestamp: datetime = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    timestamp: datetime = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Relationship back to the user
-    user = db.relationship('User', back_populates='profile_pictures')
+    user = db.relationship('User', back_populates='profile_pictures', foreign_keys=[user_id])
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
@@ -291,6 +347,12 @@ class User(db.Model, UserMixin):
 
     premium: bool = db.Column(db.Boolean, nullable=False, default=False, server_default=text('false'))
     is_public: bool = db.Column(db.Boolean, nullable=False, default=False, server_default=text('false'))
+    # Latest upload, older ones are superseded until `flask prune-profile-pictures` deletes them
+    current_profile_picture_id: Optional[int] = db.Column(
+        db.Integer,
+        db.ForeignKey('profile_pictures.id', use_alter=True, ondelete='SET NULL'),
+        nullable=True
+    )
 
     __table_args__ = (
         db.UniqueConstraint('phone_number', name='uq_users_phone_number'),
@@ -298,7 +360,9 @@ class User(db.Model, UserMixin):
 
     # Relationships
     listings = db.relationship('Listing', back_populates='creator', lazy='dynamic')
-    profile_pictures = db.relationship('ProfilePicture', back_populates='user', lazy='dynamic')
+    profile_pictures = db.relationship('ProfilePicture', back_populates='user', lazy='dynamic', foreign_keys='ProfilePicture.user_id')
+    # Updated after the picture is inserted, as each table refers to the other
+    current_profile_picture = db.relationship('ProfilePicture', foreign_keys=[current_profile_picture_id], post_update=True)
     tags = db.relationship('Tag', secondary=user_tags, back_populates='users')
     # swipes_made = db.relationship('Swipe', foreign_keys='Swipe.swiped_by_listing_id', back_populates='swiped_by_listing', lazy='dynamic')
     # swipes_received = db.relationship('Swipe', foreign_keys='Swipe.swiped_on_listing_id', back_populates='swiped_on_listing', lazy='dynamic')
@@ -558,7 +622,7 @@ class Message(db.Model):
             "id": self.id,
             "senderId": self.sender_id,
             "senderUsername": self.sender.username,
-            "senderProfilePicUrl": f"/api/users/{self.sender_id}/profile-picture",
+            "senderProfilePicUrl": f"/api/users/{self.sender_id}/profile-picture?size=64",
             "chatId": self.chat_id,  # renamed to match frontend
             "content": self.content,
             "fileUrl": self.file_url,
@@ -637,69 +701,173 @@ class Location(db.Model):
     longitude: float = db.Column(db.Float, nullable = False)
     country: Optional[str] = db.Column(db.String(2), nullable = True)
     locality: Optional[str] = db.Column(db.String(50), nullable = True)
+    geohash: Optional[str] = db.Column(db.String(12), nullable = True, index = True)
+    enrichment_status: Optional[str] = db.Column(db.String(20), nullable = True, index = True) # 'pending', 'failed', or None once geocoded
+    snap_key: Optional[str] = db.Column(db.String(80), nullable = True, unique = True) # see `Location.snap_key_for`
+    # Position on the unit sphere, ordering locations by distance with plain arithmetic
+    unit_x: Optional[float] = db.Column(db.Float, nullable = True)
+    unit_y: Optional[float] = db.Column(db.Float, nullable = True)
+    unit_z: Optional[float] = db.Column(db.Float, nullable = True)
     
     listings = db.relationship("Listing", back_populates="location")
 
     @classmethod
     def get_location_data(cls, latitude: float, longitude: float) -> tuple[str, None] | tuple[None, str]:
-        response = requests.get(f"https://maps.googleapis.com/maps/api/geocode/json?latlng={latitude},{longitude}&key={GOOGLE_API_KEY}")
-        data = response.json()
+        from .geocoding import geocoder # Imported here as geocoding depends on this module
         
-        if data["status"] != "OK":
-            raise requests.HTTPError
+        return geocoder.reverse_geocode(latitude, longitude)
+    
+    @classmethod
+    def try_get_location_data(cls, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        """Return the country and locality of a coordinate, or Nones if they cannot be retrieved."""
+        try:
+            return cls.get_location_data(latitude, longitude)
+        except requests.RequestException as error:
+            print("Error retrieving Google Maps Reverse Geocoding data:", error)
+        except AttributeError as error:
+            print("Error retrieving country and locality:", error)
         
-        if not len(data["results"]):
-            raise AttributeError("No results for these coordinates.")
+        return None, None
+    
+    def __init__(self, latitude: float, longitude: float, name: str | None = None, geocode: bool = True):
+        """
+        Args:
+            geocode (bool, optional): Look up the country and locality now, or leave the location pending enrichment
+                by `app.enrichment`. Defaults to True.
+        """
+        if abs(latitude) > 90 or abs(longitude) > 180:
+            raise ValueError("Latitude and longitude must fall within +/- 90 and +/- 180 respectively.")
         
-        country = None
-        locality = None
+        country, locality = self.try_get_location_data(latitude, longitude) if geocode else (None, None)
         
-        for result in data["results"][0]["address_components"]:
-            if "country" in result["types"]:
-                country: str = result["short_name"]
-            
-            if "locality" in result["types"]:
-                locality: str = result["long_name"]
+        super(Location, self).__init__(
+            name = name,
+            latitude = latitude,
+            longitude = longitude,
+            country = country,
+            locality = locality,
+            enrichment_status = None if geocode else "pending",
+            snap_key = self.snap_key_for(latitude, longitude, name),
+            **self.spatial_columns(latitude, longitude)
+        )
+
+    @staticmethod
+    def spatial_columns(latitude: float, longitude: float) -> dict:
+        """Return the geohash and unit-sphere position columns of a coordinate."""
+        unit_x, unit_y, unit_z = unit_vector(latitude, longitude)
+        
+        return {"geohash": encode(latitude, longitude), "unit_x": unit_x, "unit_y": unit_y, "unit_z": unit_z}
+    
+    @staticmethod
+    def snap_key_for(latitude: float, longitude: float, name: str | None = None, precision: int | None = None) -> str:
+        """Key shared by all coordinates within the same `LOCATION_SNAP_PRECISION` decimal places (4 is roughly 10 m) and with the same name."""
+        if precision is None:
+            precision = current_app.config.get("LOCATION_SNAP_PRECISION", 4)
         
-        if not country and not locality:
-            raise AttributeError("Country and locality could not be found.")
+        scale = 10 ** precision
+        key = f"{precision}:{round(latitude * scale)}:{round(longitude * scale)}"
         
-        return country, locality
+        return f"{key}:{name}" if name else key
     
-    def __init__(self, latitude: float, longitude: float, name: str | None = None):
-        if abs(latitude) > 90 or abs(longitude) > 180:
-            raise ValueError("Latitude and longitude must fall within +/- 90 and +/- 180 respectively.")
+    @classmethod
+    def get_or_create(cls, latitude: float, longitude: float, name: str | None = None, geocode: bool = True) -> "Location":
+        """Return the location snapped to the same key as the coordinates and name, creating it if there is none.
+        
+        The new location is flushed in a savepoint, so when a concurrent request inserts the same key first,
+        its location is returned instead. The caller commits.
+        
+        An existing location whose geocoding failed is geocoded again, or set pending enrichment again
+        when `geocode` is False, rather than returned without a country.
+        
+        Raises:
+            ValueError: Invalid coordinates
+        """
+        key = cls.snap_key_for(latitude, longitude, name)
+        location: Location | None = db.session.execute(
+            db.select(cls)
+            .filter_by(snap_key = key)
+        ).scalar_one_or_none()
+        
+        if location:
+            if not location.country and location.enrichment_status != "pending":
+                location.retry_geocoding(geocode)
+            
+            return location
         
-        country = None
-        locality = None
+        location = cls(latitude, longitude, name, geocode)
         
         try:
-            country, locality = self.get_location_data(latitude, longitude)
-        except requests.HTTPError as error:
-            print("Error retrieving Google Maps Reverse Geocoding data:", error)
-        except AttributeError as error:
-            print("Error retrieving country and locality:", error)
+            with db.session.begin_nested():
+                db.session.add(location)
+        except IntegrityError:
+            location = db.session.execute(
+                db.select(cls)
+                .filter_by(snap_key = key)
+            ).scalar_one()
         
-        super(Location, self).__init__(name = name, latitude = latitude, longitude = longitude, country = country, locality = locality)
+        return location
+
+    def retry_geocoding(self, geocode: bool = True):
+        """Look up the country and locality of a location left without them, filling in the currency of its
+        listings, or set it pending enrichment by `app.enrichment` when `geocode` is False. The caller commits."""
+        if not geocode:
+            self.enrichment_status = "pending"
+            
+            return
+        
+        from .enrichment import currency_for # Imported here as enrichment depends on this module
+        
+        self.country, self.locality = self.try_get_location_data(self.latitude, self.longitude)
+        
+        if not self.country:
+            return
+        
+        self.enrichment_status = None
+        
+        for listing in self.listings:
+            if listing.currency is None:
+                listing.currency = currency_for(self.country)
 
     def __repr__(self):
         return f"<Location name = {self.name}, latitude = {self.latitude}, longitude = {self.longitude}, country = {self.country}, locality = {self.locality}>"
 
+    @classmethod
+    def select_near(cls, latitude: float, longitude: float, radius: float):
+        """Select the locations in the geohash cells covering a radius (in meters) around a point.
+        
+        The result is a superset of the locations within the radius, filter it by distance.
+        """
+        return db.select(cls).filter(cells_filter(cls.geohash, covering_cells(latitude, longitude, radius)))
+
+    @classmethod
+    def select_by_distance(cls, latitude: float, longitude: float, radius: float, after: tuple[float, int] | None = None):
+        """Select the locations within a radius (in meters) of a point, nearest first, with their squared
+        chord distance (see `geocells.chord_to_metres`) to the point.
+        
+        Args:
+            after (tuple[float, int] | None, optional): Squared chord distance and ID of the last location of the
+                previous page, only locations ordered after it are selected. Defaults to None.
+        """
+        x, y, z = unit_vector(latitude, longitude)
+        distance = (cls.unit_x - x) * (cls.unit_x - x) + (cls.unit_y - y) * (cls.unit_y - y) + (cls.unit_z - z) * (cls.unit_z - z)
+        query = (
+            db.select(cls, distance.label("distance"))
+            .filter(cells_filter(cls.geohash, covering_cells(latitude, longitude, radius)))
+            .filter(distance <= chord_length(radius) ** 2)
+            .order_by(distance, cls.id)
+        )
+        
+        if after:
+            query = query.filter(or_(distance > after[0], and_(distance == after[0], cls.id > after[1])))
+        
+        return query
+
     def get_locations_within_radius(self, radius: float):
         """Return all locations within a given radius (in meters) of this location."""
         if radius <= 0:
             raise ValueError("Radius must be positive.")
         
-        lat_min = self.latitude - radius / 111
-        lat_max = self.latitude + radius / 111
-        lon_min = self.longitude - radius / (111 * abs(math.cos(math.radians(self.latitude))))
-        lon_max = self.longitude + radius / (111 * abs(math.cos(math.radians(self.latitude))))
-        
-        results = db.session.execute(
-            db.select(Location)
-            .filter(Location.latitude.between(lat_min, lat_max))
-            .filter(Location.longitude.between(lon_min, lon_max))
-        ).scalars().all()
+        results = db.session.execute(Location.select_near(self.latitude, self.longitude, radius)).scalars().all()
         locations = [location for location in results if geodist((location.latitude, location.longitude), (self.latitude, self.longitude)) <= radius]
 
         return locations
@@ -713,9 +881,20 @@ class Location(db.Model):
                 "lng": self.longitude,
             },
             "country": self.country,
-            "locality": self.locality
+            "locality": self.locality,
+            "enrichmentStatus": self.enrichment_status
         }
 
+class GeocodeCacheEntry(db.Model):
+    """Reverse geocoding result for coordinates quantized to `precision` decimal places."""
+    __tablename__ = "geocode_cache"
+    latitude_key: int = db.Column(db.Integer, primary_key = True, autoincrement = False)
+    longitude_key: int = db.Column(db.Integer, primary_key = True, autoincrement = False)
+    precision: int = db.Column(db.Integer, primary_key = True, autoincrement = False)
+    country: Optional[str] = db.Column(db.String(2), nullable = True)
+    locality: Optional[str] = db.Column(db.String(50), nullable = True)
+    created_at: datetime = db.Column(db.DateTime, nullable = False)
+
 class Friendship(db.Model):
     __tablename__ = "friendships"
     requester_id: int = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key = True)
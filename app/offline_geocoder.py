@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+from threading import Lock
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .geocells import chord_length, chord_to_metres, unit_vectors
+
+COUNTRIES_FILE = "countries.geojson" # Natural Earth admin 0 countries
+PLACES_FILE = "places.tsv" # GeoNames populated places dump, e.g. cities1000.txt
+LOCALITY_CANDIDATES = 8 # nearest places considered when looking for one in the same country
+
+class CountryBoundaries:
+    """Country polygons flattened into edge arrays, searched by bounding box then ray casting."""
+    def __init__(self, features: list[dict]):
+        codes: list[str] = []
+        boxes: list[tuple[float, float, float, float]] = []
+        self._edges: list[np.ndarray] = []
+
+        for feature in features:
+            properties = feature.get("properties") or {}
+            code = properties.get("ISO_A2")
+
+            if not code or code == "-99":
+                code = properties.get("ISO_A2_EH")
+
+            geometry = feature.get("geometry") or {}
+
+            if not code or code == "-99" or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+                continue
+
+            polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype = float)[:, :2] for ring in polygon if len(ring) >= 3]
+
+                if not rings:
+                    continue
+
+                # Each row is one edge: x1, y1, x2, y2
+                edges = np.concatenate([np.hstack([ring, np.roll(ring, -1, axis = 0)]) for ring in rings])
+                outer = rings[0]
+
+                codes.append(code.upper())
+                boxes.append((outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max()))
+                self._edges.append(edges)
+
+        self._codes = np.array(codes, dtype = str)
+        self._boxes = np.array(boxes, dtype = float).reshape(-1, 4)
+        # Smallest polygons first, so enclaves win over the country surrounding them
+        self._order = np.argsort((self._boxes[:, 2] - self._boxes[:, 0]) * (self._boxes[:, 3] - self._boxes[:, 1]))
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    @staticmethod
+    def _contains(edges: np.ndarray, x: float, y: float) -> bool:
+        x1, y1, x2, y2 = edges.T
+        straddles = (y1 > y) != (y2 > y)
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            crossings = straddles & (x < (x2 - x1) * (y - y1) / (y2 - y1) + x1)
+
+        return bool(np.count_nonzero(crossings) % 2)
+
+    def country_at(self, latitude: float, longitude: float) -> str | None:
+        boxes = self._boxes[self._order]
+        candidates = self._order[
+            (boxes[:, 0] <= longitude) & (longitude <= boxes[:, 2]) & (boxes[:, 1] <= latitude) & (latitude <= boxes[:, 3])
+        ]
+
+        for index in candidates:
+            if self._contains(self._edges[index], longitude, latitude):
+                return str(self._codes[index])
+
+        return None
+
+class PopulatedPlaces:
+    """KD-tree over the unit-sphere positions of populated places."""
+    def __init__(self, names: list[str], countries: list[str], latitudes: list[float], longitudes: list[float]):
+        self._names = names
+        self._countries = countries
+        self._tree = cKDTree(unit_vectors(latitudes, longitudes).reshape(-1, 3)) if names else None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def nearest(self, latitude: float, longitude: float, radius: float, count: int = 1) -> list[tuple[str, str, float]]:
+        """Return up to `count` places within a radius (in km) of a point as (name, country code, distance in km), nearest first."""
+        if self._tree is None:
+            return []
+
+        chords, rows = self._tree.query(
+            unit_vectors(latitude, longitude),
+            k = min(count, len(self._names)),
+            distance_upper_bound = chord_length(radius * 1000)
+        )
+        chords = np.atleast_1d(chords)
+        rows = np.atleast_1d(rows)
+        found = np.isfinite(chords)
+
+        return [
+            (self._names[row], self._countries[row], float(distance))
+            for row, distance in zip(rows[found], chord_to_metres(chords[found]) / 1000)
+        ]
+
+class OfflineReverseGeocoder:
+    """Resolves country codes from country boundaries and localities from the nearest populated place.
+
+    Data is read from `COUNTRIES_FILE` and `PLACES_FILE` in a data folder (see `flask download-geocoder-data`)
+    the first time a coordinate is resolved. Either file may be missing: without boundaries the country of
+    the nearest place is used, without places no locality is found.
+    """
+    def __init__(self, data_folder: str | None = None, locality_radius: float = 25):
+        self._lock = Lock()
+        self._is_loaded = False
+        self.data_folder = data_folder
+        self.locality_radius = locality_radius
+        self.boundaries: CountryBoundaries | None = None
+        self.places: PopulatedPlaces | None = None
+
+    @property
+    def is_available(self) -> bool:
+        """Whether any data was found in the data folder."""
+        self.ensure_loaded()
+
+        return bool(self.boundaries) or bool(self.places)
+
+    def ensure_loaded(self):
+        if self._is_loaded:
+            return
+
+        with self._lock:
+            if not self._is_loaded:
+                self.load()
+
+    def load(self):
+        self.boundaries = None
+        self.places = None
+
+        if self.data_folder:
+            countries_path = os.path.join(self.data_folder, COUNTRIES_FILE)
+            places_path = os.path.join(self.data_folder, PLACES_FILE)
+
+            if os.path.exists(countries_path):
+                with open(countries_path, encoding = "utf-8") as file:
+                    self.boundaries = CountryBoundaries(json.load(file).get("features", []))
+
+            if os.path.exists(places_path):
+                self.places = self._read_places(places_path)
+
+        self._is_loaded = True
+
+    @staticmethod
+    def _read_places(path: str) -> PopulatedPlaces:
+        names: list[str] = []
+        countries: list[str] = []
+        latitudes: list[float] = []
+        longitudes: list[float] = []
+
+        with open(path, encoding = "utf-8", newline = "") as file:
+            # GeoNames columns: id, name, ascii name, alternate names, latitude, longitude, feature class, feature code, country code, ...
+            for row in csv.reader(file, delimiter = "\t", quoting = csv.QUOTE_NONE):
+                if len(row) < 9 or row[6] != "P":
+                    continue
+
+                names.append(row[1][:50])
+                countries.append(row[8].upper() or None)
+                latitudes.append(float(row[4]))
+                longitudes.append(float(row[5]))
+
+        return PopulatedPlaces(names, countries, latitudes, longitudes)
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> tuple[str | None, str | None]:
+        """Return the country code and locality of a coordinate, either of which may be None."""
+        self.ensure_loaded()
+        country = self.boundaries.country_at(latitude, longitude) if self.boundaries else None
+        locality = None
+
+        if self.places:
+            for name, place_country, _ in self.places.nearest(latitude, longitude, self.locality_radius, LOCALITY_CANDIDATES):
+                if country is None:
+                    country = place_country
+
+                # The nearest place may lie across a border
+                if place_country == country:
+                    locality = name
+                    break
+
+        return country, locality
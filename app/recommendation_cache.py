@@ -0,0 +1,4 @@
+from .ttl_cache import TtlCache
+
+# Ranked recommendations per listing ID
+recommendation_cache: TtlCache[int, list] = TtlCache(max_size = 1024, ttl = 300, config_prefix = "RECOMMENDATION_CACHE")
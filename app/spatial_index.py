@@ -0,0 +1,232 @@
+from datetime import date
+from threading import Lock
+import time
+from typing import NamedTuple
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .extensions import db
+from .geocells import chord_length, chord_to_metres, unit_vectors
+from .models import Listing, Location
+
+REBUILD_THRESHOLD = 256 # pending changes tolerated before the tree is rebuilt
+OPEN_ENDED = np.inf # end of listings without an end date
+
+def date_ordinal(value: date | None) -> float:
+    return value.toordinal() if value else OPEN_ENDED
+
+class IndexedListing(NamedTuple):
+    point: np.ndarray
+    radius: float
+    category: str
+    start: float
+    end: float
+
+class ListingSpatialIndex:
+    """Process-local KD-tree over the unit-sphere positions of active listings, with their radii,
+    categories and date ranges.
+
+    The tree is static, so changes are kept in a small pending buffer (scanned linearly) and a
+    set of removed IDs until `REBUILD_THRESHOLD` changes accumulate and the tree is rebuilt.
+    The index is loaded lazily from the database and kept current by the listing endpoints of
+    this process. Changes made elsewhere (other workers, `flask import-listings`) are picked up
+    by reloading it once it is older than `max_age` seconds.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._is_loaded = False
+        self._loaded_at = 0.0
+        self.max_age: float | None = 60
+        self._tree: cKDTree | None = None
+        self._ids = np.empty(0, dtype = np.int64)
+        self._columns = self._stack([])
+        self._rows: dict[int, int] = {}
+        self._removed: set[int] = set()
+        self._pending: dict[int, IndexedListing] = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._is_loaded
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._removed) + len(self._pending)
+
+    @staticmethod
+    def _stack(entries: list[IndexedListing]) -> IndexedListing:
+        """Turn entries into one entry of aligned column arrays."""
+        return IndexedListing(
+            np.array([entry.point for entry in entries], dtype = float).reshape(-1, 3),
+            np.array([entry.radius for entry in entries], dtype = float),
+            np.array([entry.category for entry in entries], dtype = str),
+            np.array([entry.start for entry in entries], dtype = float),
+            np.array([entry.end for entry in entries], dtype = float)
+        )
+
+    def load(self):
+        """(Re)build the index from the database. Requires an application context."""
+        rows = db.session.execute(
+            db.select(
+                Listing.id, Location.latitude, Location.longitude, Listing.radius,
+                Listing.category, Listing.start_date, Listing.end_date
+            )
+            .join(Location, Location.id == Listing.location_id)
+            .filter(Listing.is_complete == False)
+        ).all()
+
+        ids = np.array([row[0] for row in rows], dtype = np.int64)
+        points = unit_vectors([row[1] for row in rows], [row[2] for row in rows]).reshape(-1, 3)
+        columns = IndexedListing(
+            points,
+            np.array([row[3] for row in rows], dtype = float),
+            np.array([row[4] for row in rows], dtype = str),
+            np.array([date_ordinal(row[5]) for row in rows], dtype = float),
+            np.array([date_ordinal(row[6]) for row in rows], dtype = float)
+        )
+
+        with self._lock:
+            self._build(ids, columns)
+            self._is_loaded = True
+            self._loaded_at = time.monotonic()
+
+    def init_app(self, app):
+        self.max_age = app.config.get("LISTING_SPATIAL_INDEX_MAX_AGE", self.max_age)
+
+    def ensure_loaded(self):
+        """Load the index, or reload it if it is older than `max_age` seconds."""
+        if not self._is_loaded or (self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age):
+            self.load()
+
+    def clear(self):
+        with self._lock:
+            self._build(np.empty(0, dtype = np.int64), self._stack([]))
+            self._is_loaded = False
+
+    def _build(self, ids: np.ndarray, columns: IndexedListing):
+        self._ids = ids
+        self._columns = columns
+        self._rows = {int(id): row for row, id in enumerate(ids)}
+        self._tree = cKDTree(columns.point) if len(ids) else None
+        self._removed = set()
+        self._pending = {}
+
+    def _rebuild(self):
+        kept = np.array([int(id) not in self._removed for id in self._ids], dtype = bool)
+        pending_ids = np.fromiter(self._pending.keys(), dtype = np.int64, count = len(self._pending))
+        pending_columns = self._stack(list(self._pending.values()))
+
+        self._build(
+            np.concatenate([self._ids[kept], pending_ids]),
+            IndexedListing(*(np.concatenate([column[kept], pending_column]) for column, pending_column in zip(self._columns, pending_columns)))
+        )
+
+    def _stage(self, listing_id: int, entry: IndexedListing | None):
+        if listing_id in self._rows:
+            self._removed.add(listing_id)
+
+        if entry:
+            self._pending[listing_id] = entry
+        else:
+            self._pending.pop(listing_id, None)
+
+        if len(self._pending) + len(self._removed) > REBUILD_THRESHOLD:
+            self._rebuild()
+
+    def upsert(self, listing: Listing):
+        """Add or update a listing, removing it if it is completed or has no location.
+        Does nothing until the index has been loaded."""
+        if not self._is_loaded:
+            return
+
+        if listing.is_complete or not listing.location:
+            return self.remove(listing.id)
+
+        entry = IndexedListing(
+            unit_vectors(listing.location.latitude, listing.location.longitude),
+            float(listing.radius),
+            listing.category,
+            date_ordinal(listing.start_date),
+            date_ordinal(listing.end_date)
+        )
+
+        with self._lock:
+            self._stage(listing.id, entry)
+
+    def remove(self, listing_id: int):
+        """Drop a deleted or completed listing. Does nothing until the index has been loaded."""
+        if not self._is_loaded:
+            return
+
+        with self._lock:
+            self._stage(listing_id, None)
+
+    def get(self, listing_id: int) -> IndexedListing | None:
+        """Return the indexed position, radius (in km), category and date range of a listing."""
+        self.ensure_loaded()
+
+        with self._lock:
+            if listing_id in self._pending:
+                return self._pending[listing_id]
+
+            row = self._rows.get(listing_id)
+
+            if row is None or listing_id in self._removed:
+                return None
+
+            return IndexedListing(*(column[row] for column in self._columns))
+
+    @staticmethod
+    def _matches(columns: IndexedListing, point: np.ndarray, radius: float, categories: list[str] | None, start: float | None, end: float | None) -> np.ndarray:
+        distances = chord_to_metres(np.linalg.norm(columns.point - point, axis = 1)) / 1000
+        mask = distances <= np.minimum(columns.radius, radius)
+
+        if categories is not None:
+            mask &= np.isin(columns.category, categories)
+
+        if start is not None:
+            mask &= columns.end >= start
+
+        if end is not None:
+            mask &= columns.start <= end
+
+        return mask
+
+    def query(
+        self,
+        point: np.ndarray,
+        radius: float,
+        categories: list[str] | None = None,
+        start: float | None = None,
+        end: float | None = None
+    ) -> list[int]:
+        """Return the IDs of listings within a radius (in km) of a point whose own radius also covers the point.
+
+        Args:
+            point (np.ndarray): Unit-sphere position, see `geocells.unit_vectors`
+            radius (float): Search radius in kilometres
+            categories (list[str] | None, optional): Only return listings of these categories. Defaults to None.
+            start (float | None, optional): Only return listings ending on or after this date ordinal. Defaults to None.
+            end (float | None, optional): Only return listings starting on or before this date ordinal. Defaults to None.
+
+        Returns:
+            list[int]: Matching listing IDs, in no particular order
+        """
+        self.ensure_loaded()
+        chord = chord_length(radius * 1000)
+
+        with self._lock:
+            listing_ids: list[int] = []
+
+            if self._tree is not None:
+                rows = np.array(self._tree.query_ball_point(point, chord), dtype = np.intp)
+                columns = IndexedListing(*(column[rows] for column in self._columns))
+                rows = rows[self._matches(columns, point, radius, categories, start, end)]
+                listing_ids += [int(id) for id in self._ids[rows] if int(id) not in self._removed]
+
+            if self._pending:
+                pending_ids = list(self._pending.keys())
+                mask = self._matches(self._stack(list(self._pending.values())), point, radius, categories, start, end)
+                listing_ids += [listing_id for listing_id, is_match in zip(pending_ids, mask) if is_match]
+
+        return listing_ids
+
+listing_spatial_index = ListingSpatialIndex()
@@ -0,0 +1,52 @@
+import heapq
+from threading import Lock
+from typing import Iterable
+
+from .ttl_cache import MISSING, TtlCache
+
+class SwipeDeck:
+    """Server-side cursor over a listing's recommendations, most similar first.
+
+    Candidates are heapified once, and each page only pops the entries it deals, so dealing
+    `k` recommendations costs O(k log n) instead of sorting every candidate. Listings swiped
+    while the deck is open are skipped lazily when they reach the top.
+    """
+    def __init__(self, listing_ids: list[int], scores: Iterable[float]):
+        self._lock = Lock()
+        self._heap = [(-score, position, listing_id) for position, (listing_id, score) in enumerate(zip(listing_ids, scores))]
+        self._swiped: set[int] = set()
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        """Upper bound on the number of recommendations left to deal."""
+        return len(self._heap)
+
+    def discard(self, listing_id: int):
+        with self._lock:
+            self._swiped.add(listing_id)
+
+    def deal(self, count: int) -> tuple[list[int], list[float]]:
+        listing_ids: list[int] = []
+        scores: list[float] = []
+
+        with self._lock:
+            while self._heap and len(listing_ids) < count:
+                negative_score, _, listing_id = heapq.heappop(self._heap)
+
+                if listing_id in self._swiped:
+                    continue
+
+                listing_ids.append(listing_id)
+                scores.append(float(-negative_score))
+
+        return listing_ids, scores
+
+# Open deck per listing ID
+swipe_decks: TtlCache[int, SwipeDeck] = TtlCache(max_size = 1024, ttl = 300, config_prefix = "SWIPE_DECK_CACHE")
+
+def discard_swiped(by_listing_id: int, on_listing_id: int):
+    """Skip a swiped listing in the swiping listing's open deck, if any."""
+    deck = swipe_decks.peek(by_listing_id)
+
+    if deck is not MISSING:
+        deck.discard(on_listing_id)
@@ -0,0 +1,131 @@
+from collections import Counter
+from threading import Lock
+import time
+from typing import Iterable
+
+from .extensions import db
+from .models import Listing, listing_tags
+
+class TagIndex:
+    """In-memory inverted index from tag ID to the IDs of the active listings carrying that tag.
+
+    The index is backed by the `listing_tags` table: it is loaded from it lazily on first use and
+    then kept up to date by the endpoints of this process that change a listing's tags, so lookups
+    never touch the database. Changes made elsewhere (other workers, `flask import-listings`) are
+    picked up by reloading it once it is older than `max_age` seconds.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._is_loaded = False
+        self._loaded_at = 0.0
+        self.max_age: float | None = 60
+        self._postings: dict[int, set[int]] = {}
+        self._listing_tag_ids: dict[int, frozenset[int]] = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._is_loaded
+
+    def load(self):
+        """(Re)build the index from the `listing_tags` table. Requires an application context."""
+        rows = db.session.execute(
+            db.select(listing_tags.c.listing_id, listing_tags.c.tag_id)
+            .join(Listing, Listing.id == listing_tags.c.listing_id)
+            .filter(Listing.is_complete == False)
+        ).all()
+
+        postings: dict[int, set[int]] = {}
+        listing_tag_ids: dict[int, set[int]] = {}
+
+        for listing_id, tag_id in rows:
+            postings.setdefault(tag_id, set()).add(listing_id)
+            listing_tag_ids.setdefault(listing_id, set()).add(tag_id)
+
+        with self._lock:
+            self._postings = postings
+            self._listing_tag_ids = {listing_id: frozenset(tag_ids) for listing_id, tag_ids in listing_tag_ids.items()}
+            self._is_loaded = True
+            self._loaded_at = time.monotonic()
+
+    def init_app(self, app):
+        self.max_age = app.config.get("TAG_INDEX_MAX_AGE", self.max_age)
+
+    def ensure_loaded(self):
+        """Load the index, or reload it if it is older than `max_age` seconds."""
+        if not self._is_loaded or (self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age):
+            self.load()
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._listing_tag_ids = {}
+            self._is_loaded = False
+
+    def set_listing_tags(self, listing_id: int, tag_ids: Iterable[int]):
+        """Replace a listing's tags in the index. Does nothing until the index has been loaded."""
+        if not self._is_loaded:
+            return
+
+        tag_ids = frozenset(tag_ids)
+
+        with self._lock:
+            previous_tag_ids = self._listing_tag_ids.get(listing_id, frozenset())
+
+            for tag_id in previous_tag_ids - tag_ids:
+                posting = self._postings.get(tag_id)
+
+                if posting is not None:
+                    posting.discard(listing_id)
+
+                    if not posting:
+                        del self._postings[tag_id]
+
+            for tag_id in tag_ids - previous_tag_ids:
+                self._postings.setdefault(tag_id, set()).add(listing_id)
+
+            if tag_ids:
+                self._listing_tag_ids[listing_id] = tag_ids
+            else:
+                self._listing_tag_ids.pop(listing_id, None)
+
+    def remove_listing(self, listing_id: int):
+        """Drop a deleted or completed listing from the index."""
+        self.set_listing_tags(listing_id, ())
+
+    def get_tag_ids(self, listing_id: int) -> frozenset[int]:
+        self.ensure_loaded()
+
+        return self._listing_tag_ids.get(listing_id, frozenset())
+
+    def get_listing_ids(self, tag_id: int) -> frozenset[int]:
+        """Return the posting list of a tag."""
+        self.ensure_loaded()
+
+        with self._lock:
+            return frozenset(self._postings.get(tag_id, ()))
+
+    def overlap_counts(self, tag_ids: Iterable[int], among: set[int] | None = None) -> Counter:
+        """Count, per listing, how many of the given tags it carries by merging their posting lists.
+
+        Args:
+            tag_ids (Iterable[int]): Tag IDs to look up
+            among (set[int] | None, optional): Only count these listing IDs. Defaults to None (all listings).
+
+        Returns:
+            Counter: Number of shared tags keyed by listing ID, listings sharing no tags are absent
+        """
+        self.ensure_loaded()
+        counts = Counter()
+
+        with self._lock:
+            for tag_id in set(tag_ids):
+                posting = self._postings.get(tag_id)
+
+                if not posting:
+                    continue
+
+                counts.update(posting if among is None else posting & among)
+
+        return counts
+
+tag_index = TagIndex()
@@ -0,0 +1,227 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+import hashlib
+import io
+import multiprocessing
+import os
+import secrets
+from threading import Lock
+from typing import Iterator
+
+from flask import Response, current_app, jsonify, request
+
+from .file_store import file_store, write_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Listed in requirements.txt, pictures are served without thumbnails if it is missing
+    Image = None
+
+THUMBNAIL_SIZES = (64, 256, 1024) # longest side in pixels
+THUMBNAIL_MIMETYPE = "image/webp"
+THUMBNAIL_QUALITY = 80
+BUNDLE_CHUNK_SIZE = 64 * 1024 # bytes read at a time when streaming a bundle
+
+def variant_name(size: int) -> str:
+    return f"{size}.webp"
+
+def render_thumbnail(data: bytes, size: int) -> bytes:
+    """Resize an image to fit in a square of `size` pixels, without enlarging it, and recompress it as WebP."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality = THUMBNAIL_QUALITY)
+
+        return output.getvalue()
+
+def write_thumbnails(source_path: str, targets: list[tuple[int, str]]) -> int:
+    """Render the thumbnails of a file to `(size, path)` targets. Runs in the thumbnail process pool."""
+    with open(source_path, "rb") as file:
+        data = file.read()
+
+    for size, path in targets:
+        write_file(path, render_thumbnail(data, size))
+
+    return len(targets)
+
+class Thumbnailer:
+    """Generates the `THUMBNAIL_SIZES` variants of uploaded pictures in a process pool,
+    or on demand for pictures uploaded before the variants existed."""
+    def __init__(self):
+        self._lock = Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._queued: set[str] = set() # digests whose thumbnails are being generated
+        self.processes = 2
+
+    @property
+    def is_available(self) -> bool:
+        return Image is not None
+
+    def init_app(self, app):
+        self.processes = app.config.get("THUMBNAIL_PROCESSES", self.processes)
+
+        if not self.is_available:
+            app.logger.warning("Pillow is not installed, pictures are served without thumbnails.")
+
+    def _targets(self, digest: str) -> list[tuple[int, str]]:
+        return [
+            (size, file_store.variant_path(digest, variant_name(size)))
+            for size in THUMBNAIL_SIZES
+            if not os.path.exists(file_store.variant_path(digest, variant_name(size)))
+        ]
+
+    def submit(self, digest: str):
+        """Generate the thumbnails of a stored picture in the background."""
+        targets = self._targets(digest)
+
+        if not self.is_available or not targets or self.processes <= 0:
+            return
+
+        with self._lock:
+            if digest in self._queued:
+                return
+
+            if self._pool is None:
+                # Spawned, as forking a threaded server can deadlock the children
+                self._pool = ProcessPoolExecutor(self.processes, mp_context = multiprocessing.get_context("spawn"))
+
+            self._queued.add(digest)
+            future = self._pool.submit(write_thumbnails, file_store.path(digest), targets)
+
+        future.add_done_callback(partial(self._finish, digest))
+
+    def _finish(self, digest: str, future: Future):
+        with self._lock:
+            self._queued.discard(digest)
+
+        if future.exception():
+            print(f"Error generating thumbnails of {digest}:", future.exception())
+
+    @staticmethod
+    def fitting_size(size: int) -> int:
+        """Return the smallest thumbnail size at least as large as `size`, or the largest one."""
+        return next((thumbnail_size for thumbnail_size in THUMBNAIL_SIZES if thumbnail_size >= size), THUMBNAIL_SIZES[-1])
+
+    def stored_variant(self, digest: str, size: int) -> str | None:
+        """Return the variant name of the thumbnail fitting `size` if it is stored. Otherwise queue
+        the generation of the picture's thumbnails and return None."""
+        name = variant_name(self.fitting_size(size))
+
+        if os.path.exists(file_store.variant_path(digest, name)):
+            return name
+
+        self.submit(digest)
+
+        return None
+
+    def variant(self, digest: str, size: int) -> str | None:
+        """Return the variant name of the thumbnail fitting `size`, generating it if it is missing,
+        or None if it cannot be generated."""
+        size = self.fitting_size(size)
+        name = variant_name(size)
+        path = file_store.variant_path(digest, name)
+
+        if os.path.exists(path):
+            return name
+
+        if not self.is_available or not file_store.exists(digest):
+            return None
+
+        try:
+            write_thumbnails(file_store.path(digest), [(size, path)])
+        except Exception as error:
+            print(f"Error generating thumbnail of {digest}:", error)
+
+            return None
+
+        return name
+
+thumbnailer = Thumbnailer()
+
+def send_picture(digest: str, mimetype: str, size: int | None = None, cache_control: str = "no-cache") -> Response:
+    """Respond with a stored picture, or with its thumbnail fitting `size` pixels if one can be made.
+
+    The content hash, with the name of the thumbnail if one is sent, is the ETag, so a conditional
+    request for an unchanged picture gets a 304 without the file being read. Only a stored thumbnail
+    lends its name to the ETag: the original sent when generation fails keeps the plain hash.
+    """
+    if not file_store.exists(digest):
+        response = jsonify({"error": "Picture not found."})
+        response.status_code = 404
+
+        return response
+
+    variant = thumbnailer.variant(digest, size) if size else None
+    etag = f"{digest}-{variant}" if variant else digest
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status = 304)
+    else:
+        response = file_store.send(digest, THUMBNAIL_MIMETYPE if variant else mimetype, variant)
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+
+    return response
+
+def _bundle_chunks(parts: list[tuple[bytes, str]], closing: bytes) -> Iterator[bytes]:
+    for header, path in parts:
+        yield header
+
+        with open(path, "rb") as file:
+            while chunk := file.read(BUNDLE_CHUNK_SIZE):
+                yield chunk
+
+        yield b"\r\n"
+
+    yield closing
+
+def send_picture_bundle(pictures: list[tuple[str, str, str, str]], size: int | None = None, cache_control: str = "no-cache") -> Response:
+    """Respond with several stored pictures, or their thumbnails fitting `size` pixels, in one
+    multipart/form-data body that browsers parse with `Response.formData()`.
+
+    Each `(name, filename, digest, mimetype)` picture is a part named `name`. Thumbnails are never
+    generated here: pictures without a stored thumbnail are sent as is while their thumbnails are
+    generated in the background. The files are streamed a chunk at a time, and the ETag combines
+    those of the files sent, so an unchanged bundle gets a 304 without any file being read.
+    """
+    files: list[tuple[str, str, str, str]] = [] # name, filename, path and mimetype of each part
+    etags: list[str] = []
+
+    for name, filename, digest, mimetype in pictures:
+        variant = thumbnailer.stored_variant(digest, size) if size else None
+        path = file_store.variant_path(digest, variant) if variant else file_store.path(digest)
+
+        if not os.path.exists(path):
+            continue
+
+        files.append((name, filename, path, THUMBNAIL_MIMETYPE if variant else mimetype))
+        etags.append(f"{name}:{digest}-{variant}" if variant else f"{name}:{digest}")
+
+    etag = hashlib.sha256(" ".join(etags).encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status = 304)
+    else:
+        boundary = secrets.token_hex(16)
+        parts = [(
+            (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: {mimetype}\r\n\r\n"
+            ).encode(),
+            path
+        ) for name, filename, path, mimetype in files]
+        closing = f"--{boundary}--\r\n".encode()
+        response = current_app.response_class(_bundle_chunks(parts, closing), content_type = f"multipart/form-data; boundary={boundary}")
+        response.content_length = sum(len(header) + os.path.getsize(path) + 2 for header, path in parts) + len(closing)
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+
+    return response
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+from typing import Generic, Hashable, Iterable, TypeVar
+
+MISSING = object()
+
+K = TypeVar("K", bound = Hashable)
+V = TypeVar("V")
+
+class TtlCache(Generic[K, V]):
+    """Thread-safe LRU cache with a time-to-live on every entry.
+
+    Entries are dropped explicitly by the code paths that change them, the TTL only bounds
+    staleness from changes made by other processes. `init_app` reads the `<config_prefix>_SIZE`
+    and `<config_prefix>_TTL` settings.
+    """
+    def __init__(self, max_size: int, ttl: float, config_prefix: str):
+        self._lock = Lock()
+        self.config_prefix = config_prefix
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.max_size = app.config.get(f"{self.config_prefix}_SIZE", self.max_size)
+        self.ttl = app.config.get(f"{self.config_prefix}_TTL", self.ttl)
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | object:
+        """Return the cached value of a key, or `MISSING`."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+
+                self.misses += 1
+
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def peek(self, key: K) -> V | object:
+        """Return the cached value of a key, or `MISSING`, without counting a lookup or refreshing its recency."""
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] < time.monotonic():
+            return MISSING
+
+        return entry[1]
+
+    def set(self, key: K, value: V):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[K]):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
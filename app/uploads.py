@@ -0,0 +1,77 @@
+from flask import Request, current_app
+import hashlib
+import os
+import tempfile
+from werkzeug.datastructures import FileStorage
+
+from .file_store import file_store
+
+class PictureUpload:
+    """File part of a multipart request, checked, hashed and spooled to disk while it is received.
+
+    Parts that are not images or exceed `MAX_PICTURE_SIZE` are drained without being stored and
+    marked with an `error`, so no more than a parser chunk of an upload is ever held in memory.
+    """
+    def __init__(self, folder: str, content_type: str | None, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.error: str | None = None if content_type and content_type.startswith("image/") else "Invalid file type."
+        self._hash = hashlib.sha256()
+        os.makedirs(folder, exist_ok = True)
+        descriptor, self.path = tempfile.mkstemp(dir = folder, prefix = ".upload-")
+        self._file = os.fdopen(descriptor, "w+b")
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+
+        if self.error is None and self.size > self.max_size:
+            self.error = "Image too large."
+            self._file.truncate(0)
+
+        if self.error is None:
+            self._hash.update(data)
+            self._file.write(data)
+
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def store(self) -> str:
+        """Move the upload into the file store, unless it is already stored, and return its digest."""
+        self._file.close()
+        file_store.put_file(self.path, self.digest)
+
+        return self.digest
+
+    def close(self):
+        self._file.close()
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class UploadRequest(Request):
+    """Request streaming its uploaded files into `PictureUpload`s in the file store's folder,
+    so storing one is a rename. Werkzeug closes them, deleting the ones not stored, after the request."""
+    def _get_file_stream(self, total_content_length: int | None, content_type: str | None, filename: str | None = None, content_length: int | None = None):
+        return PictureUpload(file_store.incoming_folder, content_type, current_app.config["MAX_PICTURE_SIZE"])
+
+def upload_error(files: list[FileStorage]) -> str | None:
+    """Return why one of the uploaded files cannot be stored as a picture, if one cannot."""
+    return next((file.stream.error for file in files if file.stream.error), None)
+
+def store_upload(file: FileStorage) -> dict:
+    """Move an uploaded picture into the file store and return the columns of its picture."""
+    upload: PictureUpload = file.stream
+
+    return {"content_hash": upload.store(), "image_size": upload.size, "image_mimetype": file.content_type}
@@ -0,0 +1,165 @@
+"""Benchmark the recommendation pipeline at several scales on the TestingConfig database.
+
+Usage:
+    python -m benchmarks.recommendations --scales 1000 5000 20000 --output report.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+from sqlalchemy import event
+
+os.environ["FLASK_ENV"] = "testing"
+
+from app import create_app
+from app.algorithm import (
+    candidate_listing_ids,
+    feasible_listing_ids_in_range,
+    feasible_listings_in_range,
+    listing_recommendations,
+    listings_filtered_by_swipes
+)
+from app.extensions import db
+from app.models import Listing
+from app.recommendation_cache import recommendation_cache
+from app.spatial_index import listing_spatial_index
+from app.swipe_deck import swipe_decks
+from app.tag_index import tag_index
+from benchmarks.synthetic_data import seed
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+def reset_state():
+    """Drop every process-local index and cache so scales do not leak into each other."""
+    tag_index.clear()
+    listing_spatial_index.clear()
+    recommendation_cache.clear()
+    swipe_decks.clear()
+
+def measure(function: Callable, arguments: list, counter: QueryCounter) -> dict:
+    """Time a function over a list of argument tuples and summarize latencies in milliseconds."""
+    latencies = []
+    queries = []
+
+    for args in arguments:
+        db.session.expire_all() # Do not let the identity map hide lazy loads
+        queries_before = counter.count
+        started_at = time.perf_counter()
+        function(*args)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        queries.append(counter.count - queries_before)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+    return {
+        "calls": len(latencies),
+        "p50Ms": round(float(p50), 3),
+        "p95Ms": round(float(p95), 3),
+        "p99Ms": round(float(p99), 3),
+        "meanMs": round(float(np.mean(latencies)), 3),
+        "meanQueries": round(float(np.mean(queries)), 2),
+        "maxQueries": int(max(queries))
+    }
+
+def run_scale(app, listing_count: int, samples: int, swipes_per_listing: int, include_reference: bool, rng: random.Random) -> dict:
+    counter = QueryCounter()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        reset_state()
+
+        started_at = time.perf_counter()
+        rows = seed(listing_count, swipes_per_listing = swipes_per_listing, seed = rng.randint(0, 2 ** 31))
+        seed_seconds = time.perf_counter() - started_at
+
+        listing_ids = db.session.execute(db.select(Listing.id).filter(Listing.is_complete == False)).scalars().all()
+        sample_ids = rng.sample(listing_ids, min(samples, len(listing_ids)))
+
+        event.listen(db.engine, "before_cursor_execute", counter)
+
+        try:
+            started_at = time.perf_counter()
+            listing_spatial_index.load()
+            tag_index.load()
+            index_load_seconds = time.perf_counter() - started_at
+
+            feasible_ids = {id: feasible_listing_ids_in_range(id) for id in sample_ids}
+            results = {}
+
+            if include_reference:
+                results["feasibleListingsInRange"] = measure(feasible_listings_in_range, [(id,) for id in sample_ids], counter)
+
+            results["listingsFilteredBySwipes"] = measure(
+                listings_filtered_by_swipes,
+                [(id, feasible_ids[id]) for id in sample_ids if feasible_ids[id]],
+                counter
+            )
+
+            for use_index in (True, False):
+                app.config["LISTING_SPATIAL_INDEX"] = use_index
+                mode = "Index" if use_index else "Database"
+
+                results[f"feasibleListingIdsInRange{mode}"] = measure(feasible_listing_ids_in_range, [(id,) for id in sample_ids], counter)
+                results[f"candidateListingIds{mode}"] = measure(candidate_listing_ids, [(id,) for id in sample_ids], counter)
+                results[f"listingRecommendations{mode}"] = measure(
+                    lambda id: listing_recommendations(id, use_cache = False),
+                    [(id,) for id in sample_ids],
+                    counter
+                )
+
+            app.config["LISTING_SPATIAL_INDEX"] = True
+        finally:
+            event.remove(db.engine, "before_cursor_execute", counter)
+
+    return {
+        "listings": listing_count,
+        "rows": rows,
+        "seedSeconds": round(seed_seconds, 3),
+        "indexLoadSeconds": round(index_load_seconds, 3),
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type = int, nargs = "+", default = [1000, 5000, 20000], help = "Numbers of listings to benchmark with.")
+    parser.add_argument("--samples", type = int, default = 200, help = "Listings timed per scale.")
+    parser.add_argument("--swipes-per-listing", type = int, default = 20)
+    parser.add_argument("--skip-reference", action = "store_true", help = "Do not time the ORM-based feasible_listings_in_range.")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", help = "Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    report = {
+        "benchmark": "recommendations",
+        "python": sys.version.split()[0],
+        "samples": args.samples,
+        "scales": []
+    }
+
+    for listing_count in args.scales:
+        print(f"Benchmarking {listing_count} listings...", file = sys.stderr)
+        report["scales"].append(run_scale(app, listing_count, args.samples, args.swipes_per_listing, not args.skip_reference, rng))
+
+    output = json.dumps(report, indent = 2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Synthetic, geographically clustered data for benchmarks."""
+from datetime import date, timedelta
+import math
+import random
+
+from app.extensions import db
+from app.models import Listing, Location, Swipe, Tag, User, listing_tags
+
+# (latitude, longitude, spread in km, weight)
+CITIES = [
+    (48.8566, 2.3522, 12, 10),
+    (51.5072, -0.1276, 15, 10),
+    (40.7128, -74.0060, 15, 9),
+    (45.4642, 9.1900, 8, 5),
+    (41.3874, 2.1686, 7, 5),
+    (52.5200, 13.4050, 12, 5),
+    (35.6762, 139.6503, 20, 6),
+    (-33.8688, 151.2093, 15, 3),
+    (-36.8485, 174.7633, 10, 1),
+    (64.1466, -21.9426, 5, 1),
+]
+CATEGORIES = ["short-term", "long-term", "hosting"]
+BATCH_SIZE = 5000
+
+def _insert(table, rows: list[dict]):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(table), rows[start:start + BATCH_SIZE])
+
+def _jitter(latitude: float, longitude: float, spread: float, rng: random.Random) -> tuple[float, float]:
+    """Offset a point by a normally distributed distance (in km)."""
+    latitude = min(max(latitude + rng.gauss(0, spread) / 111, -89.9), 89.9)
+    longitude += rng.gauss(0, spread) / (111 * math.cos(math.radians(latitude)))
+
+    return latitude, (longitude + 540) % 360 - 180
+
+def seed(listing_count: int, tag_count: int = 200, swipes_per_listing: int = 20, seed: int = 0) -> dict:
+    """Fill the (empty) database with users, tags, locations, listings and swipes.
+
+    Listings cluster around `CITIES` by weight, tag popularity follows a Zipf-like distribution
+    and listings only swipe on listings from their own city. Requires an application context.
+
+    Returns:
+        dict: Number of rows inserted per table
+    """
+    rng = random.Random(seed)
+    user_count = max(1, listing_count // 2)
+    today = date.today()
+
+    _insert(User, [{
+        "id": id,
+        "email": f"user{id}@example.com",
+        "password": "benchmark",
+        "username": f"user{id}",
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "birthday": date(2000, 1, 1),
+        "creation_date": today,
+        "gender": rng.choice(["male", "female"])
+    } for id in range(1, user_count + 1)])
+
+    _insert(Tag, [{"id": id, "name": f"tag{id}"} for id in range(1, tag_count + 1)])
+
+    city_weights = [city[3] for city in CITIES]
+    tag_ids = list(range(1, tag_count + 1))
+    tag_weights = [1 / rank for rank in tag_ids]
+    locations, listings, tags = [], [], []
+    listings_by_city: dict[int, list[int]] = {}
+
+    for id in range(1, listing_count + 1):
+        city = rng.choices(range(len(CITIES)), weights = city_weights)[0]
+        latitude, longitude = _jitter(*CITIES[city][:3], rng)
+        start_date = today + timedelta(days = rng.randint(1, 180))
+
+        locations.append({
+            "id": id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "country": "XX",
+            **Location.spatial_columns(latitude, longitude)
+        })
+        listings.append({
+            "id": id,
+            "user_id": rng.randint(1, user_count),
+            "location_id": id,
+            "category": rng.choice(CATEGORIES),
+            "start_date": start_date,
+            "end_date": start_date + timedelta(days = rng.randint(2, 90)) if rng.random() < 0.7 else None,
+            "dates_are_approximate": rng.random() < 0.5,
+            "is_complete": rng.random() < 0.05,
+            "radius": rng.randint(2, 30)
+        })
+        tags += [
+            {"listing_id": id, "tag_id": tag_id}
+            for tag_id in set(rng.choices(tag_ids, weights = tag_weights, k = rng.randint(0, 8)))
+        ]
+        listings_by_city.setdefault(city, []).append(id)
+
+    swipes = []
+
+    for city_listing_ids in listings_by_city.values():
+        for listing_id in city_listing_ids:
+            targets = rng.sample(city_listing_ids, min(swipes_per_listing, len(city_listing_ids)))
+            swipes += [
+                {"swiped_by_listing_id": listing_id, "swiped_on_listing_id": target_id, "is_like": rng.random() < 0.4}
+                for target_id in targets
+                if target_id != listing_id
+            ]
+
+    _insert(Location, locations)
+    _insert(Listing, listings)
+    _insert(listing_tags, tags)
+    _insert(Swipe, swipes)
+    db.session.commit()
+
+    return {
+        "users": user_count,
+        "tags": tag_count,
+        "locations": len(locations),
+        "listings": len(listings),
+        "listingTags": len(tags),
+        "swipes": len(swipes)
+    }
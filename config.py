@@ -14,12 +14,47 @@ class Config:
     SESSION_COOKIE_SECURE = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
+    MAX_PICTURE_SIZE = 5 * 1024 * 1024 # bytes
+    MAX_CONTENT_LENGTH = 64 * 1024 * 1024 # bytes per request
+    FILE_STORE_OFFLOAD = os.environ.get('FILE_STORE_OFFLOAD') # None, 'x-accel' or 'x-sendfile'
+    THUMBNAIL_PROCESSES = int(os.environ.get('THUMBNAIL_PROCESSES', 2)) # 0 to only generate thumbnails on demand
+    FILE_STORE_ACCEL_PREFIX = os.environ.get('FILE_STORE_ACCEL_PREFIX', '/protected-uploads/blobs/')
+    FILE_STORE_GRACE_PERIOD = 3600 # seconds an unreferenced file is kept after being stored
+    LISTING_PICTURE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    PROFILE_PICTURE_CACHE_CONTROL = 'public, no-cache'
+    PROFILE_PICTURE_HISTORY = int(os.environ.get('PROFILE_PICTURE_HISTORY', 0)) # superseded pictures kept per user
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    LISTING_SPATIAL_INDEX = os.environ.get('LISTING_SPATIAL_INDEX', 'false').lower() in ['true', '1'] # per-process index, see algorithm.py
+    LISTING_SPATIAL_INDEX_MAX_AGE = int(os.environ.get('LISTING_SPATIAL_INDEX_MAX_AGE', 60)) # seconds before the index is reloaded
+    TAG_INDEX_MAX_AGE = int(os.environ.get('TAG_INDEX_MAX_AGE', 60)) # seconds before the tag index is reloaded
+    RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 1024))
+    RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 300)) # seconds
+    SWIPE_DECK_CACHE_SIZE = int(os.environ.get('SWIPE_DECK_CACHE_SIZE', 1024))
+    SWIPE_DECK_CACHE_TTL = int(os.environ.get('SWIPE_DECK_CACHE_TTL', 300)) # seconds
+    RECOMMENDATION_PRECOMPUTE_MAX_AGE = int(os.environ.get('RECOMMENDATION_PRECOMPUTE_MAX_AGE', 86400)) # seconds
+    GEOCODING_BACKEND = os.environ.get('GEOCODING_BACKEND', 'offline') # 'offline', 'google' or 'stub'
+    GEOCODING_REFINE_BACKEND = os.environ.get('GEOCODING_REFINE_BACKEND', 'google') # used by 'offline', empty to disable
+    GEOCODER_DATA_FOLDER = os.environ.get('GEOCODER_DATA_FOLDER', os.path.join(basedir, 'geodata'))
+    OFFLINE_GEOCODER_LOCALITY_RADIUS = 25 # km
+    GEOCODING_CONNECT_TIMEOUT = 2 # seconds
+    GEOCODING_READ_TIMEOUT = 5 # seconds
+    GEOCODING_MAX_CONCURRENCY = 8
+    GEOCODING_RATE_LIMIT = float(os.environ.get('GEOCODING_RATE_LIMIT', 40)) # requests per second
+    GEOCODING_RETRIES = 1 # retries of failed connections
+    GEOCODING_CIRCUIT_FAILURES = 5 # consecutive failures opening the circuit
+    GEOCODING_CIRCUIT_RESET = 30 # seconds before a trial request
+    MAP_CLUSTER_CACHE_SIZE = 16384 # cells
+    MAP_CLUSTER_CACHE_TTL = 60 # seconds
+    LOCATION_SNAP_PRECISION = 4 # decimal places locations are deduplicated at, roughly 10 m
+    DEFERRED_GEOCODING = os.environ.get('DEFERRED_GEOCODING', 'false').lower() in ['true', '1']
+    LOCATION_ENRICHMENT_RETRY_DELAY = 30 # seconds before retrying a location while geocoding is unavailable
+    GEOCODE_CACHE_PRECISION = 3 # decimal places, roughly 100 m
+    GEOCODE_CACHE_SIZE = 4096
 
 class DevelopmentConfig(Config):
     DEBUG = False
@@ -28,6 +63,7 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    GEOCODING_BACKEND = 'stub'
     TESTING = False
 
 class ProductionConfig(Config):
@@ -0,0 +1,40 @@
+import { Box, Typography } from "@mui/material";
+import { useEffect, useMemo } from "react";
+import { useListingData } from "../../hooks/useListingData";
+import { ListingData } from "../../listingsConstants";
+
+export default function Cover(props: {
+    listingData: ListingData,
+    cover: Blob | null
+} | {
+    listingId: number,
+    cover: Blob | null
+}) {
+    const listingId = "listingId" in props ? props.listingId : undefined;
+    const data = useListingData(listingId);
+    const listingData = "listingData" in props ? props.listingData : data!;
+
+    const url = useMemo(() => props.cover ? URL.createObjectURL(props.cover) : null, [props.cover]);
+
+    useEffect(() => () => {
+        if (url) URL.revokeObjectURL(url);
+    }, [url]);
+
+    if (!url) return (
+        <Typography variant = "caption">No pictures yet.</Typography>
+    );
+
+    return (
+        <Box
+            component = "img"
+            src = { url }
+            alt = { `Listing #${ listingData.id } cover` }
+            sx = {{
+                height: "30dvh",
+                maxWidth: "100%",
+                objectFit: "contain",
+                borderRadius: "8px"
+            }}
+        />
+    );
+}
\ No newline at end of file
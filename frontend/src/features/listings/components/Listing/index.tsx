@@ -18,11 +18,13 @@ import Description from "./Description";
 import Profile from "./Profile";
 import Tags from "./Tags";
 import Images from "./Images";
+import Cover from "./Cover";
 import { ListingData } from "../../listingsConstants";
 
 Listing.Budget = Budget;
 Listing.Category = Category;
 Listing.CategoryAndDates = CategoryAndDates;
+Listing.Cover = Cover;
 Listing.Dates = Dates;
 Listing.Description = Description;
 Listing.GenderPreference = GenderPreference;
@@ -32,7 +34,7 @@ Listing.Name = Name;
 Listing.Profile = Profile;
 Listing.Tags = Tags;
 
-export default function Listing({ children, listingId, editable = true, stackProps }: { children?: ReactNode, listingId: number, editable?: boolean, stackProps?: StackProps }) {
+export default function Listing({ children, listingId, cover, editable = true, stackProps }: { children?: ReactNode, listingId: number, cover?: Blob | null, editable?: boolean, stackProps?: StackProps }) {
     const { sx: stackPropsSx = {}, ...stackPropsRest } = stackProps ?? {};
 
     const { data: listingData } = useSuspenseQuery({
@@ -100,7 +102,11 @@ export default function Listing({ children, listingId, editable = true, stackPro
                 <Tags listingData = { listingData } onEdit = { isEditing ? handleUpdateTags : undefined } />
                 <Location listingData = { listingData } />
                 <Description listingData = { listingData } />
-                <Images listingData = { listingData } />
+                { cover === undefined ?
+                    <Images listingData = { listingData } />
+                :
+                    <Cover listingData = { listingData } cover = { cover } />
+                }
 
                 { editable && (
                     <Box
@@ -157,7 +163,11 @@ export default function Listing({ children, listingId, editable = true, stackPro
                 <Tags listingData = { listingData } />
                 <Location listingData = { listingData } />
                 <Description listingData = { listingData } />
-                <Images listingData = { listingData } />
+                { cover === undefined ?
+                    <Images listingData = { listingData } />
+                :
+                    <Cover listingData = { listingData } cover = { cover } />
+                }
             </Stack>
         );
     }
@@ -230,7 +240,11 @@ export default function Listing({ children, listingId, editable = true, stackPro
             <Tags listingData = { listingData } />
             <Location listingData = { listingData } />
             <Description listingData = { listingData } />
-            <Images listingData = { listingData } />
+            { cover === undefined ?
+                <Images listingData = { listingData } />
+            :
+                <Cover listingData = { listingData } cover = { cover } />
+            }
         </Stack>
     );
 }
\ No newline at end of file
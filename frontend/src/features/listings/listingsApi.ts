@@ -57,10 +57,7 @@ export async function createListing({
         });
         const data = await response.json();
 
-        if (response.status === 207) {
-            console.warn(`Listing created, but the following image${ data.data.unsavedImages.length > 1 ? "s" : "" } failed to upload:`, data.data.unsavedImages);
-            return data.data.id;
-        } else if (response.ok) {
+        if (response.ok) {
             return data.data;
         }
 
@@ -230,7 +227,7 @@ export async function deleteListingTags(listingId: number, tags?: string | strin
     }
 }
 
-export async function uploadListingPictures(listingId: number, images: File | File[]): Promise<ApiResult<File[]>> {
+export async function uploadListingPictures(listingId: number, images: File | File[]): Promise<ApiResult<true>> {
     if (images && images instanceof File) {
         images = [images];
     }
@@ -247,32 +244,13 @@ export async function uploadListingPictures(listingId: number, images: File | Fi
             body: formData
         });
 
-        if (response.status === 204) {
-            return { status: "success", data: null };
+        // All pictures are saved in one transaction, or none are
+        if (response.ok) {
+            return { status: "success", data: true };
         }
 
         const data = await response.json();
-
-        if (!response.ok) {
-            throw new Error(data.error);
-        }
-
-        const unsavedImageNames: string[] = data.data.unsavedImages;
-        console.warn(`Listing created, but the following image${ unsavedImageNames.length > 1 ? "s" : "" } failed to upload:`, unsavedImageNames);
-
-        if (unsavedImageNames.length === images.length) {
-            throw new Error(`Image${ images.length > 1 ? "s" : ""} failed to uploaded.`);
-        }
-
-        const unsavedImages: File[] = [];
-
-        for (const image of images) {
-            if (unsavedImageNames.includes(image.name)) {
-                unsavedImages.push(image);
-            }
-        }
-
-        return { status: "success", data: unsavedImages };
+        throw new Error(data.error);
     } catch (error) {
         console.error(`Error uploading listing picture${ images.length > 1 ? "s" : "" }:`, error);
         return { status: "error", message: String(error) };
@@ -361,6 +339,54 @@ export async function getListingPictures(listingId: number): Promise<ApiResult<B
     }
 }
 
+/**
+ * Get the first picture of each listing of `listingIds` in a single request, as thumbnails fitting `size` pixels, by listing ID.
+ */
+// Matches MAX_COVERS in the API, larger decks are fetched in parallel bundles
+const MAX_COVERS_PER_REQUEST = 50;
+
+export async function getListingCovers(listingIds: number[], size: number = 256): Promise<ApiResult<Map<number, File>>> {
+    try {
+        const chunks: number[][] = [];
+
+        for (let start = 0; start < listingIds.length; start += MAX_COVERS_PER_REQUEST) {
+            chunks.push(listingIds.slice(start, start + MAX_COVERS_PER_REQUEST));
+        }
+
+        const bundles = await Promise.all(chunks.map(async chunk => {
+            const response = await fetch(`/api/listings/covers?ids=${ chunk.join(",") }&size=${ size }`);
+
+            if (response.status === 204) {
+                return null;
+            }
+
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.error);
+            }
+
+            return await response.formData();
+        }));
+
+        const covers = new Map<number, File>();
+
+        for (const bundle of bundles) {
+            for (const [listingId, cover] of bundle?.entries() ?? []) {
+                covers.set(Number(listingId), cover as File);
+            }
+        }
+
+        if (!covers.size) {
+            return { status: "success", data: null };
+        }
+
+        return { status: "success", data: covers };
+    } catch (error) {
+        console.error("Error retrieving listing covers:", error);
+        return { status: "error", message: String(error) };
+    }
+}
+
 export async function deleteListingPicture(listingPictureId: number): Promise<ApiResult<true>> {
     try {
         const response = await fetch(`/api/listings/pictures/${ listingPictureId }`, { method: "DELETE" });
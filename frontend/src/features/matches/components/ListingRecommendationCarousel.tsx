@@ -1,11 +1,20 @@
 import { Close, Favorite } from "@mui/icons-material";
 import { Box, Fab, Typography } from "@mui/material";
+import { useSuspenseQuery } from "@tanstack/react-query";
 import Listing from "../../listings/components/Listing";
+import { getListingCovers } from "../../listings/listingsApi";
 import { MouseEvent, useState } from "react";
 
 export default function ListingRecommendationsCarousel({ listingIds, onChange }: { listingIds: number[], onChange?: (event: MouseEvent<HTMLButtonElement>, listingId: number, isLike: boolean) => void }) {
     const [index, setIndex] = useState<number | null>(0);
 
+    // One request for the covers of the whole deck, instead of every picture of each listing
+    const { data: coversResult } = useSuspenseQuery({
+        queryKey: ["getListingCovers", listingIds],
+        queryFn: () => getListingCovers(listingIds)
+    });
+    const covers = coversResult.status === "success" ? coversResult.data : undefined;
+
     function incrementIndex() {
         if (index === null) return;
 
@@ -42,7 +51,11 @@ export default function ListingRecommendationsCarousel({ listingIds, onChange }:
 
     return (
         <>
-            <Listing key = { `listing${ listingIds[index] }` } listingId = { listingIds[index] } />
+            <Listing
+                key = { `listing${ listingIds[index] }` }
+                listingId = { listingIds[index] }
+                cover = { covers === undefined ? undefined : covers?.get(listingIds[index]) ?? null }
+            />
             <Box
                 sx = {{
                     display: "flex",
@@ -0,0 +1,26 @@
+import os
+
+# Required by config.py, unused with the testing configuration
+os.environ.setdefault("PASSWORD_HASH", "test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ["FLASK_ENV"] = "testing"
+
+import pytest
+
+from app import create_app
+from app.extensions import db
+from app.spatial_index import listing_spatial_index
+from app.tag_index import tag_index
+
+@pytest.fixture
+def app():
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+    listing_spatial_index.clear()
+    tag_index.clear()
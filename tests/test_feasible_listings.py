@@ -0,0 +1,96 @@
+from datetime import date
+import math
+import pytest
+
+from app.algorithm import feasible_listing_ids_in_range, feasible_listing_ids_in_range_from_database, feasible_listings_in_range
+from app.extensions import db
+from app.geocells import EARTH_RADIUS
+from app.models import Listing, Location, User
+
+def destination(latitude: float, longitude: float, bearing: float, distance: float) -> tuple[float, float]:
+    """Return the point `distance` km from a point along an initial bearing in degrees."""
+    latitude, longitude, bearing = map(math.radians, (latitude, longitude, bearing))
+    angle = distance * 1000 / EARTH_RADIUS
+    end_latitude = math.asin(math.sin(latitude) * math.cos(angle) + math.cos(latitude) * math.sin(angle) * math.cos(bearing))
+    end_longitude = longitude + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(latitude),
+        math.cos(angle) - math.sin(latitude) * math.sin(end_latitude)
+    )
+
+    return math.degrees(end_latitude), (math.degrees(end_longitude) + 540) % 360 - 180
+
+def add_listing(latitude: float, longitude: float, radius: int, is_complete: bool = False) -> int:
+    location = Location(latitude, longitude, geocode = False)
+    listing = Listing(
+        user_id = 1,
+        category = "hosting",
+        start_date = date(2031, 1, 1),
+        dates_are_approximate = True,
+        description = "Test listing",
+        prefers_same_gender = False,
+        radius = radius,
+        is_complete = is_complete
+    )
+    location.listings.append(listing)
+    db.session.add(location)
+    db.session.flush()
+
+    return listing.id
+
+@pytest.fixture
+def listing_ids(app) -> list[int]:
+    db.session.add(User(email = "test@example.com", password = "test", username = "tester", first_name = "Test", last_name = "User", birthday = date(2000, 1, 1), gender = "other"))
+    db.session.flush()
+    ids: list[int] = []
+
+    # Across the antimeridian, the second one too far to cover the reference with its radius
+    ids.append(add_listing(10, 179.98, 20))
+    ids.append(add_listing(10, -179.95, 20))
+    ids.append(add_listing(10, -179.85, 10))
+    ids.append(add_listing(-5, -179.99, 30))
+    ids.append(add_listing(-5.1, 179.9, 30))
+
+    # Around the poles, on opposite meridians
+    for latitude in [89.95, -89.97]:
+        for longitude in [0, 90, 180, -135]:
+            ids.append(add_listing(latitude, longitude, 15))
+
+    # Just inside and just outside the radius of a reference listing, in several directions
+    ids.append(add_listing(45, 7, 50))
+
+    for bearing in [0, 90, 200, 315]:
+        for factor in [0.97, 1.03]:
+            ids.append(add_listing(*destination(45, 7, bearing, 50 * factor), 60))
+
+    # Close enough, but its own radius does not cover the reference
+    ids.append(add_listing(*destination(45, 7, 45, 25), 24))
+    ids.append(add_listing(*destination(45, 7, 135, 10), 50, is_complete = True))
+    db.session.commit()
+
+    return ids
+
+def test_feasible_listing_ids_match_reference(app, listing_ids: list[int]):
+    completed_ids = set(db.session.execute(db.select(Listing.id).filter(Listing.is_complete == True)).scalars())
+
+    for listing_id in listing_ids:
+        if listing_id in completed_ids:
+            continue
+
+        # The reference also returns completed listings, which the other paths leave out
+        expected = {listing.id for listing in feasible_listings_in_range(listing_id)} - completed_ids
+
+        app.config["LISTING_SPATIAL_INDEX"] = True
+        from_index = set(feasible_listing_ids_in_range(listing_id))
+        app.config["LISTING_SPATIAL_INDEX"] = False
+        from_database = set(feasible_listing_ids_in_range_from_database(listing_id))
+
+        assert from_index == expected, f"Index differs for listing #{listing_id}"
+        assert from_database == expected, f"Database differs for listing #{listing_id}"
+
+def test_seeded_listings_cover_edge_cases(app, listing_ids: list[int]):
+    """Guard against a seed where every path trivially returns nothing."""
+    antimeridian_id, pole_id, reference_id = listing_ids[0], listing_ids[5], listing_ids[13]
+
+    assert set(feasible_listing_ids_in_range_from_database(antimeridian_id)) == {listing_ids[1]}
+    assert len(feasible_listing_ids_in_range_from_database(pole_id)) == 3
+    assert len(feasible_listing_ids_in_range_from_database(reference_id)) == 4
@@ -0,0 +1,50 @@
+import pytest
+import requests
+
+from app.geocoding import GoogleGeocodingBackend
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self) -> dict:
+        return self.data
+
+def backend_answering(monkeypatch, data: dict) -> GoogleGeocodingBackend:
+    backend = GoogleGeocodingBackend()
+    backend.client.breaker.failure_threshold = 2
+    monkeypatch.setattr(backend.client.session, "get", lambda *args, **kwargs: FakeResponse(data))
+
+    return backend
+
+@pytest.mark.parametrize("status", ["OVER_QUERY_LIMIT", "REQUEST_DENIED", "UNKNOWN_ERROR"])
+def test_error_statuses_open_the_circuit(monkeypatch, status: str):
+    backend = backend_answering(monkeypatch, {"status": status, "results": []})
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            backend.reverse_geocode(0, 0)
+
+    assert backend.client.breaker.state == "open"
+    assert backend.client.errors == 2
+
+def test_zero_results_is_no_result_not_a_failure(monkeypatch):
+    backend = backend_answering(monkeypatch, {"status": "ZERO_RESULTS", "results": []})
+
+    for _ in range(3):
+        with pytest.raises(AttributeError):
+            backend.reverse_geocode(0, -30)
+
+    assert backend.client.breaker.state == "closed"
+    assert backend.client.errors == 0
+
+def test_ok_status_returns_country_and_locality(monkeypatch):
+    backend = backend_answering(monkeypatch, {"status": "OK", "results": [{"address_components": [
+        {"types": ["locality", "political"], "short_name": "Paris", "long_name": "Paris"},
+        {"types": ["country", "political"], "short_name": "FR", "long_name": "France"}
+    ]}]})
+
+    assert backend.reverse_geocode(48.85, 2.35) == ("FR", "Paris")
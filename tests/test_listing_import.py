@@ -0,0 +1,19 @@
+from datetime import date
+import json
+
+from app.extensions import db
+from app.listing_import import import_listings, read_rows
+from app.models import Listing, User
+
+def test_bad_ndjson_lines_are_reported_as_invalid_rows(app, tmp_path):
+    db.session.add(User(email = "test@example.com", password = "test", username = "tester", first_name = "Test", last_name = "User", birthday = date(2000, 1, 1), gender = "other"))
+    db.session.commit()
+    row = {"user_id": 1, "latitude": 45, "longitude": 7, "radius": 10, "category": "hosting", "start_date": "2031-01-01", "description": "Test listing"}
+    path = tmp_path / "listings.ndjson"
+    path.write_text("\n".join([json.dumps(row), "[1, 2]", "{not json", "42", json.dumps(row)]) + "\n")
+
+    report = import_listings(read_rows(str(path)), batch_size = 2, defer_geocoding = True)
+
+    assert (report.rows, report.imported, report.invalid, report.failed) == (5, 2, 3, 0)
+    assert [error.split(":")[0] for error in report.errors] == ["Row 2", "Row 3", "Row 4"]
+    assert db.session.execute(db.select(db.func.count()).select_from(Listing)).scalar() == 2
@@ -0,0 +1,31 @@
+import pytest
+
+from app.extensions import db
+from app.models import Location
+
+@pytest.fixture
+def failed_location(app) -> Location:
+    location = Location(30, 30, geocode = False)
+    location.enrichment_status = "failed"
+    db.session.add(location)
+    db.session.commit()
+
+    return location
+
+def test_get_or_create_geocodes_failed_location_again(monkeypatch, failed_location: Location):
+    calls = []
+    monkeypatch.setattr(Location, "get_location_data", classmethod(lambda cls, *coordinate: calls.append(coordinate) or ("EG", "Cairo")))
+
+    location = Location.get_or_create(30.00001, 30)
+
+    assert location.id == failed_location.id
+    assert len(calls) == 1
+    assert (location.country, location.locality, location.enrichment_status) == ("EG", "Cairo", None)
+
+def test_get_or_create_sets_failed_location_pending_when_deferred(monkeypatch, failed_location: Location):
+    monkeypatch.setattr(Location, "get_location_data", classmethod(lambda cls, *coordinate: pytest.fail("Geocoded while deferred")))
+
+    location = Location.get_or_create(30.00001, 30, geocode = False)
+
+    assert location.id == failed_location.id
+    assert location.enrichment_status == "pending"
@@ -0,0 +1,26 @@
+from datetime import date
+
+from app.extensions import db
+from app.models import Listing, Location, Tag, User, listing_tags
+from app.tag_index import tag_index
+
+def test_tags_changed_elsewhere_are_picked_up_after_max_age(app):
+    db.session.add(User(email = "test@example.com", password = "test", username = "tester", first_name = "Test", last_name = "User", birthday = date(2000, 1, 1), gender = "other"))
+    location = Location(45, 7, geocode = False)
+    listing = Listing(user_id = 1, category = "hosting", start_date = date(2031, 1, 1), dates_are_approximate = True, description = "Test listing", prefers_same_gender = False, radius = 10)
+    location.listings.append(listing)
+    tag = Tag(name = "hiking")
+    db.session.add_all([location, tag])
+    db.session.commit()
+
+    tag_index.max_age = 60
+    assert tag_index.get_tag_ids(listing.id) == frozenset()
+
+    # As another worker or `flask import-listings` would, without going through the index
+    db.session.execute(db.insert(listing_tags).values(listing_id = listing.id, tag_id = tag.id))
+    db.session.commit()
+
+    assert tag_index.get_tag_ids(listing.id) == frozenset()
+
+    tag_index.max_age = 0
+    assert tag_index.get_tag_ids(listing.id) == frozenset([tag.id])
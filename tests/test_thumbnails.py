@@ -0,0 +1,19 @@
+from app import thumbnails
+from app.file_store import file_store
+from app.thumbnails import send_picture
+
+def test_failed_thumbnail_sends_original_under_its_own_etag(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(file_store, "root", str(tmp_path))
+    # Pillow "installed", but unable to open the picture
+    monkeypatch.setattr(thumbnails, "Image", object())
+    digest = file_store.put(b"not an image")
+
+    with app.test_request_context():
+        response = send_picture(digest, "image/png", 64)
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.get_etag() == (digest, False)
+
+    with app.test_request_context(headers = {"If-None-Match": f'"{digest}"'}):
+        assert send_picture(digest, "image/png", 64).status_code == 304